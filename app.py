@@ -1,27 +1,45 @@
 import eventlet
 eventlet.monkey_patch()
 
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, render_template, request, jsonify
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_login import LoginManager, current_user, login_required
-from datetime import datetime, timedelta
+from flask_migrate import Migrate
 import os
-import json
+import sys
+import atexit
+import signal
 
 # Import modules
 from config import Config
-from models import db, User, Group, GroupMember, Message, ActivityLog
+from models import db, init_engines, ActivityLog, PasswordResetToken, LoginKey
 from auth import auth_bp
 from groups import groups_bp
-from messages import messages_bp
-from utils import cleanup_expired_messages
+from messages import messages_bp, send_group_message
+from expiry import expiry_scheduler, expiry_engine, init_expiry
+from cache import membership_cache, identity_cache
+from presence import presence_tracker, typing_aggregator
+from bus import message_bus
+from scheduler import job_scheduler
+from images import image_pipeline
+from writer import message_writer
+from uploads import upload_urls
+from history import recent_messages
+from serializers import JSONProvider, SocketJSON
+from passwords import password_hasher
+from ratelimit import rate_limiter
+from audit import audit_log
+from mailer import mailer
 
 # Initialize app
 app = Flask(__name__)
 app.config.from_object(Config)
+app.json = JSONProvider(app)
 
 # Initialize extensions
 db.init_app(app)
+init_engines(app)
+migrate = Migrate(app, db)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -32,17 +50,70 @@ login_manager.login_message_category = 'info'
 socketio = SocketIO(app, 
                    cors_allowed_origins="*", 
                    async_mode='eventlet',
+                   message_queue=app.config['MESSAGE_QUEUE_URL'],
+                   json=SocketJSON,
                    ping_timeout=60,
                    ping_interval=25)
 
+message_bus.init_app(app, socketio)
+
+init_expiry(app, socketio)
+membership_cache.init_app(app)
+identity_cache.init_app(app)
+presence_tracker.init_app(app, socketio)
+typing_aggregator.init_app(app, socketio)
+job_scheduler.init_app(app, socketio)
+image_pipeline.init_app(app, socketio)
+message_writer.init_app(app, socketio)
+# To'xtashda navbatdagi xabarlar DB ga yoziladi
+atexit.register(message_writer.close)
+upload_urls.init_app(app)
+recent_messages.init_app(app)
+password_hasher.init_app(app)
+rate_limiter.init_app(app)
+audit_log.init_app(app)
+atexit.register(audit_log.close)
+mailer.init_app(app, socketio)
+app.add_template_global(image_pipeline.renditions, 'image_renditions')
+app.add_template_global(upload_urls.sign, 'upload_url')
+
+# Background jobs
+job_scheduler.add_job('message_expiry', expiry_scheduler.tick, interval=1, leader_only=True)
+job_scheduler.add_job('password_reset_cleanup', PasswordResetToken.cleanup_expired,
+                      interval=3600, leader_only=True)
+job_scheduler.add_job('activity_log_prune',
+                      lambda: ActivityLog.cleanup_expired(app.config['ACTIVITY_LOG_RETENTION_DAYS']),
+                      interval=3600, leader_only=True)
+job_scheduler.add_job('audit_flush', audit_log.flush,
+                      interval=app.config['AUDIT_FLUSH_INTERVAL'])
+job_scheduler.add_job('presence_flush', presence_tracker.flush,
+                      interval=app.config['PRESENCE_FLUSH_INTERVAL'])
+job_scheduler.add_job('typing_flush', typing_aggregator.flush,
+                      interval=app.config['TYPING_INTERVAL'], jitter=0)
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(groups_bp, url_prefix='/groups')
 app.register_blueprint(messages_bp, url_prefix='/api')
 
+def start_background():
+    """Bus tinglovchisi va fon vazifalari (expiry, presence, audit, ...) - bir marta
+
+    Har qanday kirish nuqtasida (python app.py, flask run, gunicorn) birinchi so'rov yoki
+    Socket.IO ulanishida ishga tushadi - so'rovlarga javob beradigan jarayonda. Testlarda o'chiq.
+    """
+    if app.testing:
+        return
+    message_bus.start()
+    job_scheduler.start()
+
+@app.before_request
+def ensure_background():
+    start_background()
+
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    return identity_cache.load(int(user_id))
 
 # Main route
 @app.route('/')
@@ -52,30 +123,47 @@ def index():
 
 # Uploads route
 @app.route('/uploads/<path:filename>')
-@login_required
 def uploaded_file(filename):
-    return send_from_directory(os.path.join(app.config['UPLOAD_FOLDER']), filename)
+    # Imzolangan URL - sessiya va DB so'rovisiz; aks holda oddiy login tekshiruvi
+    if not upload_urls.verify(filename, request.args.get('e'), request.args.get('s')):
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+    return upload_urls.send(filename)
+
+# Background workers status
+@app.route('/stats')
+@login_required
+def stats():
+    """Fon vazifalari va navbatlar holati"""
+    return jsonify({
+        'jobs': job_scheduler.stats(),
+        'images': image_pipeline.stats(),
+        'writer': message_writer.stats(),
+        'history': recent_messages.stats(),
+        'passwords': password_hasher.stats(),
+        'rate_limited': rate_limiter.rejected,
+        'audit': audit_log.stats(),
+        'mail': mailer.stats(),
+        'expiry': expiry_engine.stats
+    })
 
 # SocketIO events
 @socketio.on('connect')
 @login_required
 def handle_connect():
     """Client ulanganda"""
+    # Socket.IO so'rovlari Flask before_request dan o'tmaydi
+    start_background()
     print(f"✅ {current_user.username} ulandi")
     
-    # Update user status
-    current_user.is_online = True
-    current_user.update_last_seen()
+    # Update user status (xotirada, DB ga davriy yoziladi)
+    presence_tracker.connect(current_user.id, current_user.username)
     
     # Join user's groups
-    user_groups = GroupMember.query.filter_by(user_id=current_user.id).all()
-    for member in user_groups:
-        room = f"group_{member.group_id}"
+    for group_id in membership_cache.get_group_ids(current_user.id):
+        room = f"group_{group_id}"
         join_room(room)
         print(f"📌 {current_user.username} joined room: {room}")
-    
-    # Emit online status
-    emit('user_online', {'user_id': current_user.id, 'username': current_user.username}, broadcast=True)
 
 @socketio.on('disconnect')
 @login_required
@@ -83,22 +171,20 @@ def handle_disconnect():
     """Client uzilganda"""
     print(f"❌ {current_user.username} uzildi")
     
-    # Update user status
-    current_user.is_online = False
-    current_user.update_last_seen()
-    
-    # Emit offline status
-    emit('user_offline', {'user_id': current_user.id, 'username': current_user.username}, broadcast=True)
+    # Update user status (offline e'loni qisqa kutishdan keyin)
+    presence_tracker.disconnect(current_user.id, current_user.username)
 
 @socketio.on('join_group')
 @login_required
 def handle_join_group(data):
     """Guruh xonasiga qo'shilish"""
-    group_id = data.get('group_id')
-    group = Group.query.get_or_404(group_id)
+    try:
+        group_id = int(data.get('group_id'))
+    except (TypeError, ValueError):
+        return
     
     # Check if user is member
-    if group.is_member(current_user):
+    if membership_cache.is_member(group_id, current_user.id):
         room = f"group_{group_id}"
         join_room(room)
         print(f"📌 {current_user.username} joined group room: {room}")
@@ -121,51 +207,46 @@ def handle_leave_group(data):
         'username': current_user.username
     }, room=room)
 
+@socketio.on('send_group_message')
+@login_required
+def handle_send_group_message(data):
+    """Xabar yuborish (HTTP so'rovsiz); ack: {'success', 'message'} yoki {'error'}"""
+    return send_group_message(data or {})
+
 @socketio.on('typing_group')
 @login_required
 def handle_typing_group(data):
     """Guruhda yozayotganligi haqida xabar"""
-    group_id = data.get('group_id')
-    is_typing = data.get('is_typing', False)
+    try:
+        group_id = int(data.get('group_id'))
+    except (TypeError, ValueError):
+        return
     
-    room = f"group_{group_id}"
-    emit('user_typing', {
-        'user_id': current_user.id,
-        'username': current_user.username,
-        'is_typing': is_typing
-    }, room=room, include_self=False)
-
-# Cleanup task (runs every minute)
-@socketio.on('start_cleanup')
-def handle_cleanup():
-    """Muddati o'tgan xabarlarni o'chirish"""
-    import threading
-    import time
+    # Faqat guruh a'zolari; xabar darhol emas, aggregator orqali yuboriladi
+    if rate_limiter.hit('typing', current_user.id):
+        return
+    if not membership_cache.is_member(group_id, current_user.id):
+        return
     
-    def cleanup_job():
-        while True:
-            time.sleep(60)  # Every minute
-            with app.app_context():
-                deleted_count = cleanup_expired_messages()
-                if deleted_count > 0:
-                    print(f"🧹 {deleted_count} ta muddati o'tgan xabar o'chirildi")
-                    socketio.emit('cleanup_complete', {
-                        'deleted_count': deleted_count,
-                        'timestamp': datetime.utcnow().isoformat()
-                    })
-    
-    thread = threading.Thread(target=cleanup_job, daemon=True)
-    thread.start()
+    typing_aggregator.update(group_id, current_user.id, current_user.username,
+                             bool(data.get('is_typing', False)))
 
 if __name__ == '__main__':
     with app.app_context():
         # Create database tables
         db.create_all()
         
+        # create_all mavjud jadvallarni o'zgartirmaydi: eski bazada login_keys bo'sh yaratiladi
+        # (to'liq sxema uchun `flask db upgrade`), shu sababli kalitlar shu yerda to'ldiriladi
+        LoginKey.backfill()
+        
         # Create upload folders
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'avatars'), exist_ok=True)
         os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'group_avatars'), exist_ok=True)
+        
+        # Warm recent message history (birinchi sahifalar xotiradan)
+        recent_messages.warm()
     
     print("""
     ============================================
@@ -178,7 +259,15 @@ if __name__ == '__main__':
     ============================================
     """)
     
-    # Start cleanup job
-    socketio.start_background_task(handle_cleanup)
+    debug = True
+    
+    # debug da Werkzeug reloader ota jarayoni faqat fayllarni kuzatadi, so'rovlarga bola jarayon
+    # (WERKZEUG_RUN_MAIN=true) javob beradi - fon vazifalari va leader lock faqat shu jarayonda.
+    # Bu yerda so'rovni kutmasdan (qayta ishga tushgandan keyingi expiry uchun)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background()
+    
+    # SIGTERM da ham atexit ishlashi uchun (yozilmagan xabarlar yo'qolmaydi)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     
-    socketio.run(app, host='0.0.0.0', port=5000,debug=True)
\ No newline at end of file
+    socketio.run(app, host='0.0.0.0', port=5000, debug=debug)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from models import db, ActivityLog
+
+
+class AuditLog:
+    """Faoliyat loglarini (ActivityLog) navbatga yig'ib, fon vazifasida multi-row INSERT bilan yozish
+
+    So'rov faqat navbatga qo'shadi (commit yo'q). Navbat AUDIT_QUEUE_MAX dan oshsa,
+    eng eski yozuvlar tashlanadi - DB ishlamay qolganda xotira cheksiz o'smasligi uchun.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self.app = None
+        self.batch_size = 500
+        self.queue_max = 10000
+        self.written = 0
+        self.dropped = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', 500)
+        self.queue_max = app.config.get('AUDIT_QUEUE_MAX', 10000)
+
+    def record(self, action, user_id=None, details=None, ip_address=None):
+        """Hodisani navbatga qo'shish (DB ga keyingi flush da yoziladi)"""
+        entry = {
+            'user_id': user_id,
+            'action': action,
+            'details': details,
+            'ip_address': ip_address,
+            'created_at': datetime.utcnow()
+        }
+        with self._lock:
+            self._pending.append(entry)
+            overflow = len(self._pending) - self.queue_max
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+
+    def flush(self):
+        """Navbatdagi yozuvlarni partiyalab yozish (davriy vazifa va to'xtashda)"""
+        written = 0
+        while True:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            if not batch:
+                return written
+
+            try:
+                db.session.execute(insert(ActivityLog), batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Keyingi urinishda qayta yozish
+                with self._lock:
+                    self._pending[:0] = batch
+                raise
+            written += len(batch)
+            self.written += len(batch)
+
+    def close(self):
+        """To'xtashda qolgan yozuvlarni yozish"""
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"To'xtashda {len(self._pending)} ta log yozilmadi: {e}")
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+
+audit_log = AuditLog()
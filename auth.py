@@ -2,11 +2,19 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
 from datetime import datetime
+import math
 import secrets
 
-from models import db, User, PasswordResetToken, ActivityLog
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, PasswordResetToken, LoginKey
 from forms import LoginForm, RegistrationForm, PasswordResetRequestForm, PasswordResetForm
 from utils import send_password_reset_email
+from cache import identity_cache
+from expiry import image_reaper
+from presence import presence_tracker
+from ratelimit import rate_limiter
+from audit import audit_log
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -24,17 +32,17 @@ def register():
         )
         
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Parallel ro'yxatdan o'tish shu username/email ni oldinroq band qildi
+            db.session.rollback()
+            flash('Bu username yoki email allaqachon band', 'danger')
+            return render_template('auth/register.html', form=form)
         
-        # Log activity
-        log = ActivityLog(
-            user_id=user.id,
-            action='register',
-            details=f'User registered with email: {user.email}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(log)
-        db.session.commit()
+        # Log activity (navbat orqali, fonda yoziladi)
+        audit_log.record('register', user.id, f'User registered with email: {user.email}',
+                         request.remote_addr)
         
         flash('Muvaffaqiyatli ro\'yxatdan o\'tdingiz! Endi tizimga kirishingiz mumkin.', 'success')
         return redirect(url_for('auth.login'))
@@ -48,26 +56,26 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
-        # Username or email bilan qidirish
-        user = User.query.filter(
-            (User.username == form.username.data) | 
-            (User.email == form.username.data)
-        ).first()
+        # Cheklov DB so'rovi va parol tekshiruvidan (KDF) oldin
+        identifier = form.username.data.strip().lower()
+        retry_after = max(rate_limiter.hit('login_ip', request.remote_addr),
+                          rate_limiter.hit('login', identifier))
+        if retry_after:
+            return too_many_attempts('auth/login.html', form, retry_after)
+        
+        # Username or email bilan qidirish (login_keys PK bo'yicha bitta so'rov)
+        user = LoginKey.find_user(identifier)
         
         if user and user.verify_password(form.password.data):
+            # Eski hash (boshqa sxema yoki narx) bo'lsa yangilanadi
+            if user.rehash_password(form.password.data):
+                db.session.commit()
+            rate_limiter.reset('login', identifier)
             login_user(user, remember=form.remember_me.data)
-            user.is_online = True
-            user.update_last_seen()
+            presence_tracker.touch(user.id)
             
             # Log activity
-            log = ActivityLog(
-                user_id=user.id,
-                action='login',
-                details='User logged in',
-                ip_address=request.remote_addr
-            )
-            db.session.add(log)
-            db.session.commit()
+            audit_log.record('login', user.id, 'User logged in', request.remote_addr)
             
             flash(f'Xush kelibsiz, {user.username}!', 'success')
             next_page = request.args.get('next')
@@ -80,19 +88,10 @@ def login():
 @auth_bp.route('/logout')
 @login_required
 def logout():
-    user = current_user
-    user.is_online = False
-    user.update_last_seen()
+    presence_tracker.touch(current_user.id)
     
     # Log activity
-    log = ActivityLog(
-        user_id=user.id,
-        action='logout',
-        details='User logged out',
-        ip_address=request.remote_addr
-    )
-    db.session.add(log)
-    db.session.commit()
+    audit_log.record('logout', current_user.id, 'User logged out', request.remote_addr)
     
     logout_user()
     flash('Tizimdan chiqdingiz', 'info')
@@ -105,7 +104,12 @@ def reset_request():
     
     form = PasswordResetRequestForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
+        retry_after = max(rate_limiter.hit('reset_ip', request.remote_addr),
+                          rate_limiter.hit('reset', form.email.data.strip().lower()))
+        if retry_after:
+            return too_many_attempts('auth/reset_request.html', form, retry_after)
+        
+        user = LoginKey.find_user(form.email.data, kind='email')
         if user:
             # Generate token
             token = secrets.token_urlsafe(32)
@@ -129,6 +133,12 @@ def reset_request():
     
     return render_template('auth/reset_request.html', form=form)
 
+def too_many_attempts(template, form, retry_after):
+    """Cheklovdan oshgan urinish - 429 va Retry-After"""
+    seconds = math.ceil(retry_after)
+    flash(f'Juda ko\'p urinish. {seconds} soniyadan keyin qayta urinib ko\'ring', 'danger')
+    return render_template(template, form=form), 429, {'Retry-After': str(seconds)}
+
 @auth_bp.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_token(token):
     if current_user.is_authenticated:
@@ -153,6 +163,7 @@ def reset_token(token):
         reset_token.is_used = True
         
         db.session.commit()
+        identity_cache.invalidate(user.id)
         
         flash('Parolingiz muvaffaqiyatli yangilandi! Endi tizimga kirishingiz mumkin.', 'success')
         return redirect(url_for('auth.login'))
@@ -162,26 +173,31 @@ def reset_token(token):
 @auth_bp.route('/profile')
 @login_required
 def profile():
-    return render_template('auth/profile.html', user=current_user)
+    return render_template('auth/profile.html', user=current_user.get_user())
 
 @auth_bp.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
+    user = current_user.get_user()
     if request.method == 'POST':
         # Update user profile
-        current_user.bio = request.form.get('bio', '')
+        user.bio = request.form.get('bio', '')
         
+        orphans = []
         # Handle avatar upload
         if 'avatar' in request.files:
             file = request.files['avatar']
             if file and file.filename:
-                from utils import save_image
+                from utils import save_image, release_image
                 filename = save_image(file, 'avatars')
                 if filename:
-                    current_user.avatar = filename
+                    orphans = release_image(user.avatar, 'avatars')
+                    user.avatar = filename
         
         db.session.commit()
+        image_reaper.submit(orphans)
+        identity_cache.invalidate(user.id)
         flash('Profil muvaffaqiyatli yangilandi', 'success')
         return redirect(url_for('auth.profile'))
     
-    return render_template('auth/edit_profile.html', user=current_user)
\ No newline at end of file
+    return render_template('auth/edit_profile.html', user=user)
\ No newline at end of file
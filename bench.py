@@ -0,0 +1,210 @@
+"""Benchmarklar (vaqtinchalik SQLite faylida, ilova bazasiga tegmaydi)
+
+    python bench.py engine   - engine profillari: standart va SQLITE_PRAGMAS (WAL, ...) - yozish/o'qish
+    python bench.py json     - tarix sahifasini kodlash: stdlib json va serializers.dumps
+    python bench.py audit    - auth.login (test klient): har so'rovda commit va audit_log navbati
+    python bench.py          - hammasi
+
+engine benchmarki haqiqiy threadlar bilan o'lchanadi, app.py esa import paytida
+eventlet.monkey_patch() qiladi - shuning uchun app faqat audit benchmarkida (oxirida) import qilinadi.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+# Config import paytida o'qiladi: app bazasi ham vaqtinchalik papkada
+WORKDIR = tempfile.mkdtemp(prefix='chat-bench-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(WORKDIR, "app.db")}'
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from sqlalchemy import create_engine, event, insert, select
+
+from config import Config, engine_options
+from models import db, _apply_pragmas, Message
+import serializers
+
+
+def best_of(func, repeat=5):
+    """Eng yaxshi natija (soniya)"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def message_row(i, now):
+    return {
+        'user_id': i % 100 + 1,
+        'group_id': i % 20 + 1,
+        'content': 'salom dunyo ' * 5,
+        'created_at': now + timedelta(microseconds=i),
+        'expires_at': now + timedelta(minutes=10),
+        'is_deleted': False,
+    }
+
+
+def make_engine(path, profile):
+    uri = f'sqlite:///{path}'
+    if profile == 'default':
+        engine = create_engine(uri)
+    else:
+        engine = create_engine(uri, **engine_options(uri, Config.DB_POOL_SIZE))
+        event.listen(engine, 'connect', partial(_apply_pragmas, Config.SQLITE_PRAGMAS, False))
+    db.metadata.create_all(engine)
+    return engine
+
+
+def bench_engine(writes, seconds, readers):
+    print(f'engine: {writes} ta commit, {seconds}s davomida {readers} o\'quvchi + 1 yozuvchi')
+    history = (select(Message.id, Message.content, Message.created_at)
+               .where(Message.group_id == 7, Message.is_deleted == False)
+               .order_by(Message.created_at.desc(), Message.id.desc()).limit(50))
+
+    for profile in ('default', 'tuned'):
+        engine = make_engine(os.path.join(WORKDIR, f'{profile}.db'), profile)
+        now = datetime.utcnow()
+
+        # Har bir xabar alohida tranzaksiya (commit narxi)
+        started = time.perf_counter()
+        for i in range(writes):
+            with engine.begin() as conn:
+                conn.execute(insert(Message), [message_row(i, now)])
+        commits = writes / (time.perf_counter() - started)
+
+        with engine.begin() as conn:
+            conn.execute(insert(Message), [message_row(i, now) for i in range(writes, writes + 20000)])
+
+        # Yozuvchi ishlayotganda tarix so'rovlari (WAL da o'quvchilar kutmaydi)
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def reader():
+            done = errors = 0
+            while time.perf_counter() < deadline:
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(history).all()
+                    done += 1
+                except Exception:
+                    errors += 1
+            with lock:
+                counts['reads'] += done
+                counts['errors'] += errors
+
+        def writer():
+            done = errors = 0
+            i = writes + 20000
+            while time.perf_counter() < deadline:
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(insert(Message), [message_row(i, now)])
+                    done += 1
+                except Exception:
+                    errors += 1
+                i += 1
+            with lock:
+                counts['writes'] += done
+                counts['errors'] += errors
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+        print(f'  {profile:8} {commits:8.0f} commit/s   aralash: {counts["reads"] / seconds:8.0f} o\'qish/s '
+              f'{counts["writes"] / seconds:6.0f} yozish/s  xato: {counts["errors"]}')
+
+
+def bench_json(messages):
+    print(f'json: {messages} ta xabar bitta sahifada (backend: {serializers.BACKEND})')
+    now = datetime.utcnow().isoformat()
+    payloads = [{
+        'id': i, 'user': 'alice', 'user_id': 1, 'user_avatar': 'default.png',
+        'user_avatar_src': '/uploads/default.png?e=1&s=abc', 'content': 'salom dunyo ' * 5,
+        'client_id': None, 'image_url': None, 'image_src': None, 'image_renditions': None,
+        'image_pending': False, 'created_at': now, 'expires_at': now, 'group_id': 1
+    } for i in range(messages)]
+    parts = [serializers.dumps(payload) for payload in payloads]
+
+    # Flask standart provideri: sort_keys=True, ixcham ajratgichlar
+    stdlib = best_of(lambda: json.dumps(payloads, sort_keys=True, separators=(',', ':')))
+    fast = best_of(lambda: serializers.dumps(payloads))
+    joined = best_of(lambda: serializers.encode_page(parts, None))
+    print(f'  {"stdlib json":20} {stdlib * 1000:8.1f} ms')
+    print(f'  {"serializers":20} {fast * 1000:8.1f} ms')
+    print(f'  {"oldindan kodlangan":20} {joined * 1000:8.1f} ms (halqadagi tayyor baytlardan)')
+
+
+def bench_audit(logins):
+    print(f'audit: {logins} ta POST /auth/login (BCRYPT_ROUNDS={os.environ["BCRYPT_ROUNDS"]})')
+    from app import app
+    from models import User
+    from audit import audit_log
+    from ratelimit import rate_limiter
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Fon vazifalari (audit_flush) ishga tushmaydi - flush ni benchmark o'zi chaqiradi
+    app.testing = True
+    rate_limiter.limits = {}
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', email='bench@example.com', password='secret1'))
+        db.session.commit()
+
+    def run(flush_each):
+        started = time.perf_counter()
+        for _ in range(logins):
+            response = app.test_client().post('/auth/login', data={'username': 'bench', 'password': 'secret1'})
+            assert response.status_code == 302, response.status_code
+            if flush_each:
+                with app.app_context():
+                    audit_log.flush()
+        # Navbatdagilar ham yozilguncha (flush vaqti hisobda)
+        with app.app_context():
+            audit_log.flush()
+        return logins / (time.perf_counter() - started)
+
+    # Eski usul: har login so'rov ichida alohida commit
+    sync = run(flush_each=True)
+    # Navbat: so'rov faqat qo'shadi, fon vazifasi partiyalab yozadi
+    queued = run(flush_each=False)
+    print(f'  {"commit har loginda":20} {sync:8.0f} login/s')
+    print(f'  {"audit_log navbati":20} {queued:8.0f} login/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chat ilovasi benchmarklari')
+    parser.add_argument('name', nargs='?', choices=('engine', 'json', 'audit'))
+    parser.add_argument('--writes', type=int, default=500, help='engine: ketma-ket commitlar soni')
+    parser.add_argument('--seconds', type=float, default=3, help='engine: aralash yuklama davomiyligi')
+    parser.add_argument('--readers', type=int, default=4, help='engine: o\'quvchi threadlar')
+    parser.add_argument('--messages', type=int, default=10000, help='json: sahifadagi xabarlar')
+    parser.add_argument('--logins', type=int, default=500, help='audit: login so\'rovlari soni')
+    args = parser.parse_args()
+
+    try:
+        if args.name in (None, 'engine'):
+            bench_engine(args.writes, args.seconds, args.readers)
+        if args.name in (None, 'json'):
+            bench_json(args.messages)
+        # Oxirida: app importi monkey_patch qiladi
+        if args.name in (None, 'audit'):
+            bench_audit(args.logins)
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
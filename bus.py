@@ -0,0 +1,103 @@
+import json
+
+
+class LocalBackend:
+    """Bitta jarayon uchun: signallar darhol shu jarayonda qayta ishlanadi"""
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+
+    def publish(self, channel, payload):
+        self.dispatch(channel, payload)
+
+    def listen(self):
+        pass
+
+
+class RedisBackend:
+    """Bir nechta worker uchun: signallar Redis pub/sub orqali tarqatiladi"""
+
+    def __init__(self, url, dispatch, prefix='chat:bus:'):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.dispatch = dispatch
+        self.prefix = prefix
+
+    def publish(self, channel, payload):
+        self.redis.publish(self.prefix + channel, json.dumps(payload))
+
+    def listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + '*')
+        for message in pubsub.listen():
+            channel = message['channel'].decode()[len(self.prefix):]
+            self.dispatch(channel, json.loads(message['data']))
+
+
+class MessageBus:
+    """Guruh hodisalari va ichki signallarni (kesh invalidatsiyasi) barcha workerlarga yetkazish
+
+    Socket.IO hodisalari SocketIO(message_queue=...) orqali yuboriladi, shuning uchun
+    har bir worker faqat o'ziga ulangan klientlarga bir martadan yetkazadi.
+    """
+
+    def __init__(self):
+        self.socketio = None
+        self.backend = LocalBackend(self._dispatch)
+        self._handlers = {}
+        # True - signallar barcha workerlarga yetadi (Redis yoki bitta jarayon)
+        self.shared = True
+        self._started = False
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        url = app.config.get('MESSAGE_QUEUE_URL')
+        if url and url.startswith(('redis://', 'rediss://')):
+            self.backend = RedisBackend(url, self._dispatch)
+            self.shared = True
+        else:
+            self.backend = LocalBackend(self._dispatch)
+            # Boshqa message queue (masalan zmq) - Socket.IO uchun yetarli, ichki signallar esa
+            # faqat shu jarayonda qoladi; ularga tayanadigan xotira keshlari (a'zolik, identity,
+            # xabarlar halqasi) o'chiriladi - ular init_app da shu qiymatni o'qiydi
+            self.shared = not url
+            if url:
+                print(f"Message bus signallari faqat shu jarayonda (Redis emas): {url}")
+
+    def emit(self, event, data, room):
+        """Xonadagi barcha klientlarga hodisa yuborish"""
+        self.socketio.emit(event, data, to=room)
+
+    def subscribe(self, channel, handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel, payload):
+        """Ichki signal: barcha workerlardagi (shu jumladan o'zidagi) handlerlarga"""
+        self.backend.publish(channel, payload)
+
+    def _dispatch(self, channel, payload):
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"Bus handler xatoligi ({channel}): {e}")
+
+    def start(self):
+        """Tinglovchini bir marta ishga tushirish, qayta chaqiruvlar e'tiborsiz qoldiriladi"""
+        if self._started:
+            return
+        self._started = True
+        self.socketio.start_background_task(self.run)
+
+    def run(self):
+        """Signallarni tinglash fon vazifasi (uzilsa qayta ulanadi)"""
+        while True:
+            try:
+                self.backend.listen()
+                return
+            except Exception as e:
+                print(f"Message bus ulanishi uzildi: {e}")
+                self.socketio.sleep(1)
+
+
+message_bus = MessageBus()
@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from models import db, GroupMember, User
+from bus import message_bus
+
+
+class LRUCache:
+    """Hajmi va yashash muddati (TTL) cheklangan LRU kesh"""
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MembershipCache:
+    """Foydalanuvchi guruhlari (user_id -> group_id lar) va guruh rollari (group_id -> {user_id: role}) keshi
+
+    Invalidatsiya boshqa workerlarga bus orqali yetadi - bus jarayonlararo bo'lmasa
+    (message_bus.shared=False) kesh ishlatilmaydi, har so'rov DB dan.
+    """
+
+    def __init__(self):
+        self.user_groups = LRUCache()
+        self.group_roles = LRUCache()
+        self.enabled = True
+
+    def init_app(self, app):
+        maxsize = app.config.get('MEMBERSHIP_CACHE_SIZE', 10000)
+        ttl = app.config.get('MEMBERSHIP_CACHE_TTL', 60)
+        self.user_groups = LRUCache(maxsize, ttl)
+        self.group_roles = LRUCache(maxsize, ttl)
+        self.enabled = message_bus.shared
+        message_bus.subscribe('cache.membership', self._drop)
+
+    def get_group_ids(self, user_id):
+        group_ids = self.user_groups.get(user_id) if self.enabled else None
+        if group_ids is None:
+            rows = db.session.execute(select(GroupMember.group_id).filter_by(user_id=user_id)).all()
+            group_ids = frozenset(row.group_id for row in rows)
+            if self.enabled:
+                self.user_groups.set(user_id, group_ids)
+        return group_ids
+
+    def get_roles(self, group_id):
+        roles = self.group_roles.get(group_id) if self.enabled else None
+        if roles is None:
+            rows = db.session.execute(
+                select(GroupMember.user_id, GroupMember.role).filter_by(group_id=group_id)
+            ).all()
+            roles = {row.user_id: row.role for row in rows}
+            if self.enabled:
+                self.group_roles.set(group_id, roles)
+        return roles
+
+    def get_role(self, group_id, user_id):
+        """A'zoning roli, a'zo bo'lmasa None"""
+        return self.get_roles(group_id).get(user_id)
+
+    def is_member(self, group_id, user_id):
+        return group_id in self.get_group_ids(user_id)
+
+    def can_manage(self, group_id, user_id):
+        return self.get_role(group_id, user_id) in GroupMember.MANAGER_ROLES
+
+    def invalidate(self, group_id, user_id):
+        """A'zolik o'zgarganda (qo'shilish, chiqish, rol) chaqiriladi"""
+        self.invalidate_group(group_id, [user_id])
+
+    def invalidate_group(self, group_id, user_ids):
+        """Guruh o'chirilganda barcha a'zolar keshini tozalash"""
+        payload = {'group_id': group_id, 'user_ids': list(user_ids)}
+        # Shu worker darhol, qolganlari bus orqali
+        self._drop(payload)
+        message_bus.publish('cache.membership', payload)
+
+    def _drop(self, payload):
+        self.group_roles.pop(payload['group_id'])
+        for user_id in payload['user_ids']:
+            self.user_groups.pop(user_id)
+
+
+class UserIdentity:
+    """Flask-Login uchun yengil foydalanuvchi obyekti (faqat identifikatsiya maydonlari)"""
+
+    __slots__ = ('id', 'username', 'avatar', 'is_active')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username, avatar, is_active):
+        self.id = id
+        self.username = username
+        self.avatar = avatar
+        self.is_active = is_active
+
+    def get_id(self):
+        return str(self.id)
+
+    def get_user(self):
+        """To'liq User qatori (o'zgartirish uchun)"""
+        return db.session.get(User, self.id)
+
+    def __getattr__(self, name):
+        # email, bio va boshqa maydonlar faqat kerak bo'lganda DB dan olinadi
+        return getattr(self.get_user(), name)
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class IdentityCache:
+    """user_loader uchun user_id -> UserIdentity keshi (bus jarayonlararo bo'lmasa - DB dan)"""
+
+    def __init__(self):
+        self._cache = LRUCache()
+        self.enabled = True
+
+    def init_app(self, app):
+        self._cache = LRUCache(app.config.get('IDENTITY_CACHE_SIZE', 10000),
+                               app.config.get('IDENTITY_CACHE_TTL', 300))
+        self.enabled = message_bus.shared
+        message_bus.subscribe('cache.identity', self._drop)
+
+    def load(self, user_id):
+        identity = self._cache.get(user_id) if self.enabled else None
+        if identity is None:
+            row = db.session.execute(select(
+                User.id, User.username, User.avatar, User.is_active
+            ).filter_by(id=user_id)).first()
+            if row is None:
+                return None
+            identity = UserIdentity(*row)
+            if self.enabled:
+                self._cache.set(user_id, identity)
+        return identity
+
+    def invalidate(self, user_id):
+        """Profil yoki parol o'zgarganda chaqiriladi"""
+        payload = {'user_id': user_id}
+        self._drop(payload)
+        message_bus.publish('cache.identity', payload)
+
+    def _drop(self, payload):
+        self._cache.pop(payload['user_id'])
+
+
+membership_cache = MembershipCache()
+identity_cache = IdentityCache()
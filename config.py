@@ -4,11 +4,59 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def is_memory_uri(uri):
+    return uri == 'sqlite://' or ':memory:' in uri
+
+
+def engine_options(uri, pool_size):
+    """Baza turiga mos engine profili (pool sozlamalari)"""
+    if is_memory_uri(uri):
+        # In-memory SQLite da SQLAlchemy StaticPool ishlatadi - pool argumentlari TypeError beradi
+        return {}
+    if uri.startswith('sqlite'):
+        # PRAGMA lar models.init_engines da har bir ulanishga qo'llanadi
+        return {'pool_size': pool_size, 'max_overflow': pool_size * 2, 'pool_timeout': 10}
+    if uri.startswith('postgresql'):
+        return {
+            'pool_size': pool_size,
+            'max_overflow': pool_size * 2,
+            'pool_timeout': 10,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True,
+        }
+    return {'pool_pre_ping': True}
+
+
+def reader_binds(uri, read_uri, pool_size):
+    """O'qish uchun alohida pool: SQLite da shu fayl (query_only), PostgreSQL da replika bo'lishi mumkin"""
+    uri = read_uri or uri
+    if is_memory_uri(uri):
+        # In-memory baza har ulanishda boshqa - alohida pool ma'nosiz
+        return {}
+    return {'reader': dict(engine_options(uri, pool_size), url=uri)}
+
+
 class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///chat.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Engine profili: yozuvchi (asosiy) va o'quvchi poollar
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 10))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE)
+    SQLALCHEMY_BINDS = reader_binds(SQLALCHEMY_DATABASE_URI, os.environ.get('DATABASE_READ_URL'),
+                                    DB_READ_POOL_SIZE)
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',      # o'quvchilar yozuvchini kutmaydi
+        'synchronous': 'NORMAL',    # WAL da xavfsiz, har commitda fsync yo'q
+        'busy_timeout': 5000,       # ms, "database is locked" o'rniga kutish
+        'cache_size': -64000,       # KiB (64 MB)
+        'mmap_size': 268435456,     # 256 MB
+        'temp_store': 'MEMORY',
+    }
+    
     # Security
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT') or 'password-salt'
@@ -19,14 +67,81 @@ class Config:
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
+    # Password hashing (tpool da, bir vaqtdagi soni cheklangan)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'bcrypt')  # bcrypt | scrypt
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+    SCRYPT_COST = (2 ** 15, 8, 1)  # N, r, p
+    PASSWORD_HASH_WORKERS = 2
+    
+    # Rate limits (token bucket): nom -> (urinishlar, soniyalar)
+    RATE_LIMITS = {
+        'login_ip': (30, 60),
+        'login': (5, 60),  # username/email bo'yicha
+        'reset_ip': (10, 3600),
+        'reset': (3, 3600),  # email bo'yicha
+        'message': (30, 10),  # user bo'yicha (HTTP va Socket.IO)
+        'typing': (20, 10),
+    }
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')  # default: MESSAGE_QUEUE_URL (redis)
+    RATELIMIT_MEMORY_SIZE = 100000
+    
     # File Upload
     UPLOAD_FOLDER = 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    MAX_IMAGE_PIXELS = 40_000_000  # dekodlashdan oldin tekshiriladi (decompression bomb)
+    UPLOAD_SPOOL_SIZE = 1024 * 1024  # bundan katta yuklamalar diskdagi temp faylga
+    IMAGE_WORKERS = 4  # bir vaqtda qayta ishlanadigan rasmlar (tpool)
+    RENDITION_SIZES = (64, 200, 400)  # xabar rasmlari uchun srcset nusxalari (px), asosiy rasmdan katta emas
+    RENDITION_FORMATS = ('AVIF', 'WEBP', 'JPEG')  # afzallik tartibida, Pillow qo'llasa
+    
+    # Uploads delivery (imzolangan URL lar)
+    UPLOAD_URL_SECRET = os.environ.get('UPLOAD_URL_SECRET')  # bo'lmasa SECRET_KEY
+    UPLOAD_URL_TTL = 3600
+    UPLOAD_DELIVERY = os.environ.get('UPLOAD_DELIVERY', 'direct')  # direct | x-sendfile | x-accel-redirect
+    UPLOAD_ACCEL_PREFIX = '/protected-uploads/'  # nginx internal location
     
     # Message auto-delete time (10 minutes)
     MESSAGE_LIFETIME = 600  # seconds
     
+    # Message history pagination
+    MESSAGE_PAGE_SIZE = 50
+    MESSAGE_PAGE_MAX = 100
+    RECENT_MESSAGES_SIZE = 100  # guruh bo'yicha xotirada saqlanadigan so'nggi xabarlar (>= MESSAGE_PAGE_MAX)
+    
+    # Xabarlar fonda partiyalab yoziladi (write-behind, group commit)
+    MESSAGE_BATCH_SIZE = 100
+    MESSAGE_BATCH_WINDOW = 0.005  # seconds
+    MESSAGE_ID_BLOCK = 100  # bir marta band qilinadigan id lar soni (hi/lo)
+    
+    # Membership cache
+    MEMBERSHIP_CACHE_SIZE = 10000
+    MEMBERSHIP_CACHE_TTL = 60  # seconds
+    
+    # Session user (identity) cache
+    IDENTITY_CACHE_SIZE = 10000
+    IDENTITY_CACHE_TTL = 300  # seconds
+    
+    # Presence (onlayn holat)
+    PRESENCE_DEBOUNCE = 5  # seconds, qayta ulanishda offline e'lon qilinmaydi
+    PRESENCE_FLUSH_INTERVAL = 10  # seconds
+    
+    # Typing indicator
+    TYPING_INTERVAL = 0.3  # seconds, guruhga snapshot yuborish oralig'i
+    TYPING_TTL = 3  # seconds
+    
+    # Expiry scheduler
+    EXPIRY_CHUNK_SIZE = 500  # bitta DELETE dagi xabarlar soni
+    EXPIRY_SWEEP_INTERVAL = 5  # seconds, boshqa workerlar yuborgan xabarlar uchun
+    
+    # Background jobs
+    SCHEDULER_TICK = 0.1  # seconds
+    SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE')  # default: instance/scheduler.lock
+    ACTIVITY_LOG_RETENTION_DAYS = 90
+    AUDIT_FLUSH_INTERVAL = 1  # seconds, faoliyat loglari navbatdan partiyalab yoziladi
+    AUDIT_BATCH_SIZE = 500
+    AUDIT_QUEUE_MAX = 10000
+    
     # Email settings (for password reset)
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -35,5 +150,17 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
     
+    # Outbound email queue (lokal sinov: python -m aiosmtpd -n -l localhost:8025, MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=false)
+    MAIL_WORKERS = 2  # bir vaqtda ochiq SMTP ulanishlar
+    MAIL_QUEUE_MAX = 1000
+    MAIL_BATCH_SIZE = 50  # bitta ulanish orqali yuboriladigan xatlar
+    MAIL_IDLE_TIMEOUT = 30  # seconds, xat bo'lmasa ulanish yopiladi
+    MAIL_RETRIES = 3
+    MAIL_RETRY_BACKOFF = 2  # seconds, har urinishda ikki barobar
+    
     # Redis (for temporary storage)
-    REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
\ No newline at end of file
+    REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    
+    # Bir nechta worker uchun Socket.IO message queue (masalan REDIS_URL yoki zmq+tcp://...)
+    # None - bitta jarayon, hodisalar xotirada tarqatiladi
+    MESSAGE_QUEUE_URL = os.environ.get('MESSAGE_QUEUE_URL')
\ No newline at end of file
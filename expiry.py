@@ -0,0 +1,181 @@
+import heapq
+import queue
+import threading
+import time
+from datetime import datetime
+
+from models import db, Message, UploadBlob
+from bus import message_bus
+from history import recent_messages
+from images import is_stored, remove_upload
+
+
+class ImageReaper:
+    """O'chirilgan xabarlarning rasmlarini fonda o'chirish"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._started = False
+        self.upload_folder = None
+        self.socketio = None
+        self.bytes_reclaimed = 0
+        self.files_removed = 0
+
+    def init_app(self, app, socketio):
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.socketio = socketio
+
+    def submit(self, urls):
+        """uploads/... URL larini navbatga qo'shish"""
+        if not urls:
+            return
+        if not self._started:
+            self._started = True
+            self.socketio.start_background_task(self._worker)
+        for url in urls:
+            self._queue.put(url)
+
+    def _worker(self):
+        while True:
+            url = self._queue.get()
+            size = remove_upload(self.upload_folder, url)
+            if size:
+                self.bytes_reclaimed += size
+                self.files_removed += 1
+
+
+class ExpiryEngine:
+    """Muddati o'tgan xabarlarni partiyalab (set-based) o'chirish"""
+
+    def __init__(self, reaper):
+        self.reaper = reaper
+        self.socketio = None
+        self.chunk_size = 500
+        self.stats = {
+            'rows_deleted': 0,
+            'last_rows': 0,
+            'last_duration': 0.0,
+            'last_rows_per_sec': 0.0,
+        }
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.chunk_size = app.config.get('EXPIRY_CHUNK_SIZE', 500)
+
+    def purge(self, now=None):
+        """Barcha muddati o'tgan xabarlarni o'chirish, o'chirilganlar sonini qaytaradi"""
+        now = now or datetime.utcnow()
+        started = time.monotonic()
+        deleted_count = 0
+
+        while True:
+            rows = Message.delete_expired_batch(now, self.chunk_size)
+            if not rows:
+                break
+
+            deleted_count += len(rows)
+            self._notify_rooms(rows)
+            self.reaper.submit(self._release_images([row.image_url for row in rows if row.image_url]))
+
+            if len(rows) < self.chunk_size:
+                break
+            # Partiyalar orasida boshqa yozuvchilarga navbat berish
+            self.socketio.sleep(0)
+
+        duration = time.monotonic() - started
+        self.stats['rows_deleted'] += deleted_count
+        self.stats['last_rows'] = deleted_count
+        self.stats['last_duration'] = duration
+        self.stats['last_rows_per_sec'] = deleted_count / duration if duration > 0 else 0.0
+        return deleted_count
+
+    def _release_images(self, urls):
+        """O'chirish mumkin bo'lgan fayllar: eski uslubdagilar va oxirgi havolasi ketganlar"""
+        stored = [url for url in urls if is_stored(url)]
+        legacy = [url for url in urls if not is_stored(url)]
+        if stored:
+            legacy.extend(UploadBlob.release(stored))
+            db.session.commit()
+        return legacy
+
+    def _notify_rooms(self, rows):
+        by_group = {}
+        for row in rows:
+            by_group.setdefault(row.group_id, []).append(row.id)
+
+        for group_id, message_ids in by_group.items():
+            recent_messages.remove(group_id, message_ids)
+            message_bus.emit('delete_group_message', {
+                'message_ids': message_ids,
+                'group_id': group_id
+            }, room=f'group_{group_id}')
+
+
+class ExpiryScheduler:
+    """Xabarlar muddatini min-heap orqali kuzatib, vaqti kelganda engine ni ishga tushirish"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._heap = []
+        self._lock = threading.Lock()
+        self.active = False
+        self.sweep_interval = 5
+        self._next_sweep = 0
+
+    def init_app(self, app):
+        self.sweep_interval = app.config.get('EXPIRY_SWEEP_INTERVAL', 5)
+
+    def schedule(self, expires_at):
+        """Yangi xabar muddatini navbatga qo'shish (faqat lider workerda)"""
+        if not self.active:
+            return
+        with self._lock:
+            heapq.heappush(self._heap, expires_at)
+
+    def load_pending(self):
+        """Hali muddati o'tmagan xabarlarni navbatga yuklash"""
+        rows = db.session.query(Message.expires_at).filter(
+            Message.expires_at > datetime.utcnow()
+        ).all()
+
+        with self._lock:
+            self._heap = [row.expires_at for row in rows]
+            heapq.heapify(self._heap)
+        return len(rows)
+
+    def _pop_due(self, now):
+        due = 0
+        with self._lock:
+            while self._heap and self._heap[0] <= now:
+                heapq.heappop(self._heap)
+                due += 1
+        return due
+
+    def tick(self):
+        """Davriy vazifa (lider worker): muddati kelgan yoki boshqa workerlardan qolgan xabarlarni o'chirish"""
+        if not self.active:
+            self.active = True
+            self.load_pending()
+
+        now = datetime.utcnow()
+        if not self._pop_due(now) and time.monotonic() < self._next_sweep:
+            return 0
+        self._next_sweep = time.monotonic() + self.sweep_interval
+
+        deleted_count = self.engine.purge(now)
+        if deleted_count > 0:
+            print(f"🧹 {deleted_count} ta muddati o'tgan xabar o'chirildi "
+                  f"({self.engine.stats['last_rows_per_sec']:.0f} qator/s, "
+                  f"{self.engine.reaper.bytes_reclaimed} bayt bo'shatildi)")
+        return deleted_count
+
+
+image_reaper = ImageReaper()
+expiry_engine = ExpiryEngine(image_reaper)
+expiry_scheduler = ExpiryScheduler(expiry_engine)
+
+
+def init_expiry(app, socketio):
+    image_reaper.init_app(app, socketio)
+    expiry_engine.init_app(app, socketio)
+    expiry_scheduler.init_app(app)
@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, TextAreaField, BooleanField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
-from models import User
+from wtforms.validators import DataRequired, Email, EqualTo, Length
+from models import LoginKey
 
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[
@@ -23,15 +23,17 @@ class RegistrationForm(FlaskForm):
     ])
     submit = SubmitField('Ro\'yxatdan o\'tish')
     
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('Bu username allaqachon mavjud')
-    
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Bu email allaqachon ro\'yxatdan o\'tgan')
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        
+        # Username va email bandligi bitta so'rovda (katta-kichik harfsiz)
+        taken = LoginKey.taken(self.username.data, self.email.data)
+        if 'username' in taken:
+            self.username.errors.append('Bu username allaqachon mavjud')
+        if 'email' in taken:
+            self.email.errors.append('Bu email allaqachon ro\'yxatdan o\'tgan')
+        return not taken
 
 class LoginForm(FlaskForm):
     username = StringField('Username or Email', validators=[DataRequired()])
@@ -1,10 +1,15 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 
 from models import db, Group, GroupMember, Message, User
 from forms import GroupForm, EditGroupForm, InviteUserForm
-from utils import save_image, delete_image
+from utils import save_image, release_image
+from cache import membership_cache
+from history import recent_messages
+from expiry import image_reaper
 
 groups_bp = Blueprint('groups', __name__)
 
@@ -54,6 +59,7 @@ def create_group():
         )
         db.session.add(member)
         db.session.commit()
+        membership_cache.invalidate(group.id, current_user.id)
         
         flash(f'Guruh "{group.name}" muvaffaqiyatli yaratildi!', 'success')
         return redirect(url_for('groups.view_group', group_id=group.id))
@@ -67,12 +73,7 @@ def view_group(group_id):
     group = Group.query.get_or_404(group_id)
     
     # Check if user is member
-    member = GroupMember.query.filter_by(
-        group_id=group_id, 
-        user_id=current_user.id
-    ).first()
-    
-    if not member:
+    if not membership_cache.is_member(group_id, current_user.id):
         # Check if group is public
         if not group.is_private:
             # Auto-join public groups
@@ -82,20 +83,36 @@ def view_group(group_id):
                 role='member'
             )
             db.session.add(new_member)
-            db.session.commit()
-            member = new_member
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Kesh eskirgan yoki parallel so'rov oldinroq qo'shdi - a'zolik allaqachon bor
+                db.session.rollback()
+            membership_cache.invalidate(group_id, current_user.id)
         else:
             flash('Bu guruhga kirish uchun ruxsat yo\'q', 'danger')
             return redirect(url_for('groups.list_groups'))
     
-    # Get recent messages
-    messages = Message.query.filter_by(
-        group_id=group_id, 
-        is_deleted=False
-    ).order_by(Message.created_at.desc()).limit(50).all()
+    # Get recent messages (xotiradan; bo'lmasa mualliflar bilan bitta so'rovda)
+    recent = recent_messages.page(group_id, 50)
+    if recent is not None:
+        messages = [message for message in recent[0] if message.user is not None]
+    else:
+        messages = Message.query.options(joinedload(Message.user)).filter(
+            Message.group_id == group_id,
+            Message.is_deleted == False,
+            # Muddati o'tgan, lekin hali o'chirilmagan xabarlarni ko'rsatmaslik
+            Message.expires_at > datetime.utcnow()
+        ).order_by(Message.created_at.desc(), Message.id.desc()).limit(50).all()
     
     # Get members
-    members = GroupMember.query.filter_by(group_id=group_id).all()
+    members = GroupMember.query.options(joinedload(GroupMember.user)).filter_by(group_id=group_id).all()
+    member = next((m for m in members if m.user_id == current_user.id), None)
+    if member is None:
+        # Kesh eskirgan bo'lsa
+        membership_cache.invalidate(group_id, current_user.id)
+        flash('Bu guruhga kirish uchun ruxsat yo\'q', 'danger')
+        return redirect(url_for('groups.list_groups'))
     
     return render_template('groups/view.html', 
                          group=group, 
@@ -120,20 +137,20 @@ def edit_group(group_id):
         group.name = form.name.data
         group.description = form.description.data
         
+        orphans = []
         # Handle avatar update
         if 'avatar' in request.files:
             file = request.files['avatar']
             if file and file.filename:
-                # Delete old avatar
-                if group.avatar and group.avatar != 'group_default.png':
-                    delete_image(group.avatar, 'group_avatars')
-                
-                # Save new avatar
+                # Save new avatar (eskisi faqat yangisi saqlangandan keyin o'chiriladi)
                 filename = save_image(file, 'group_avatars')
                 if filename:
+                    if group.avatar and group.avatar != 'group_default.png':
+                        orphans = release_image(group.avatar, 'group_avatars')
                     group.avatar = filename
         
         db.session.commit()
+        image_reaper.submit(orphans)
         flash('Guruh ma\'lumotlari yangilandi', 'success')
         return redirect(url_for('groups.view_group', group_id=group_id))
     
@@ -150,6 +167,17 @@ def delete_group(group_id):
         flash('Faqat guruh egasi guruhni o\'chira oladi', 'danger')
         return redirect(url_for('groups.view_group', group_id=group_id))
     
+    member_ids = list(membership_cache.get_roles(group_id))
+    
+    # Release message images and group avatar (fayllar commit dan keyin o'chiriladi)
+    image_urls = db.session.query(Message.image_url).filter(
+        Message.group_id == group_id,
+        Message.image_url.isnot(None)
+    ).all()
+    orphans = release_image(group.avatar, 'group_avatars')
+    for row in image_urls:
+        orphans.extend(release_image(row.image_url, f'group_{group_id}_images'))
+    
     # Delete all messages
     Message.query.filter_by(group_id=group_id).delete()
     
@@ -159,6 +187,9 @@ def delete_group(group_id):
     # Delete group
     db.session.delete(group)
     db.session.commit()
+    image_reaper.submit(orphans)
+    membership_cache.invalidate_group(group_id, member_ids)
+    recent_messages.drop(group_id)
     
     flash('Guruh o\'chirildi', 'success')
     return redirect(url_for('groups.list_groups'))
@@ -170,12 +201,7 @@ def invite_to_group(group_id):
     group = Group.query.get_or_404(group_id)
     
     # Check permissions
-    member = GroupMember.query.filter_by(
-        group_id=group_id, 
-        user_id=current_user.id
-    ).first()
-    
-    if not member or not member.is_admin():
+    if not membership_cache.can_manage(group_id, current_user.id):
         flash('Bu amal uchun ruxsat yo\'q', 'danger')
         return redirect(url_for('groups.view_group', group_id=group_id))
     
@@ -188,12 +214,7 @@ def join_group(invite_code):
     group = Group.query.filter_by(invite_code=invite_code).first_or_404()
     
     # Check if already member
-    existing_member = GroupMember.query.filter_by(
-        group_id=group.id,
-        user_id=current_user.id
-    ).first()
-    
-    if existing_member:
+    if membership_cache.is_member(group.id, current_user.id):
         flash('Siz allaqachon bu guruh a\'zosisiz', 'info')
     else:
         # Add new member
@@ -204,6 +225,7 @@ def join_group(invite_code):
         )
         db.session.add(member)
         db.session.commit()
+        membership_cache.invalidate(group.id, current_user.id)
         
         flash(f'"{group.name}" guruhiga qo\'shildingiz!', 'success')
     
@@ -247,6 +269,7 @@ def change_member_role(group_id, user_id):
     if new_role in ['admin', 'member']:
         member.role = new_role
         db.session.commit()
+        membership_cache.invalidate(group_id, user_id)
         return jsonify({'success': True, 'role': new_role})
     
     return jsonify({'error': 'Noto\'g\'ri rol'}), 400
@@ -258,12 +281,7 @@ def remove_member(group_id, user_id):
     group = Group.query.get_or_404(group_id)
     
     # Check permissions
-    member = GroupMember.query.filter_by(
-        group_id=group_id,
-        user_id=current_user.id
-    ).first()
-    
-    if not member or not member.is_admin():
+    if not membership_cache.can_manage(group_id, current_user.id):
         return jsonify({'error': 'Ruxsat yo\'q'}), 403
     
     target_member = GroupMember.query.filter_by(
@@ -277,6 +295,7 @@ def remove_member(group_id, user_id):
     
     db.session.delete(target_member)
     db.session.commit()
+    membership_cache.invalidate(group_id, user_id)
     
     return jsonify({'success': True})
 
@@ -299,6 +318,7 @@ def leave_group(group_id):
     if member:
         db.session.delete(member)
         db.session.commit()
+        membership_cache.invalidate(group_id, current_user.id)
         flash(f'"{group.name}" guruhidan chiqdingiz', 'success')
     
     return redirect(url_for('groups.list_groups'))
@@ -0,0 +1,266 @@
+import threading
+from bisect import insort
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import db, Message
+from cache import identity_cache
+from bus import message_bus
+from uploads import upload_urls
+from serializers import dumps, message_payload
+
+# Bus orqali yuboriladigan maydonlar (sanalar ISO satr ko'rinishida)
+FIELDS = ('id', 'user_id', 'group_id', 'content', 'image_url', 'created_at', 'expires_at')
+
+
+class RecentMessage:
+    """Xotiradagi xabar (shablon va API uchun Message qatoriga o'xshash)"""
+
+    __slots__ = FIELDS + ('image_pending', 'encoded')
+
+    def __init__(self, id, user_id, group_id, content, image_url, created_at, expires_at,
+                 image_pending=False):
+        self.id = id
+        self.user_id = user_id
+        self.group_id = group_id
+        self.content = content
+        self.image_url = image_url
+        self.created_at = created_at
+        self.expires_at = expires_at
+        # Rasm hali qayta ishlanmoqda: havola o'rniga joy egallovchi (image-{id}) ko'rsatiladi
+        self.image_pending = image_pending
+        self.encoded = None  # ((URL oynasi, muallif), JSON baytlar)
+
+    @property
+    def position(self):
+        return (self.created_at, self.id)
+
+    @property
+    def user(self):
+        """Muallif (identity keshidan - username va avatar doim joriy)"""
+        return identity_cache.load(self.user_id)
+
+    def encode(self, author=None):
+        """Tarix uchun JSON baytlar; imzolar oynasi va muallif o'zgarmaguncha qayta ishlatiladi"""
+        author = author or self.user
+        key = (upload_urls.window(), author)
+        if self.encoded is None or self.encoded[0][0] != key[0] or self.encoded[0][1] is not author:
+            self.encoded = (key, dumps(message_payload(self, author, self.group_id,
+                                                       image_pending=self.image_pending)))
+        return self.encoded[1]
+
+    def __lt__(self, other):
+        return self.position < other.position
+
+    @classmethod
+    def from_payload(cls, payload):
+        values = dict(payload)
+        values['created_at'] = datetime.fromisoformat(values['created_at'])
+        values['expires_at'] = datetime.fromisoformat(values['expires_at'])
+        return cls(**{field: values.get(field) for field in FIELDS},
+                   image_pending=values.get('image_pending', False))
+
+
+class Ring:
+    """Bitta guruhning eng so'nggi xabarlari, (created_at, id) bo'yicha o'sish tartibida"""
+
+    __slots__ = ('entries', 'loaded', 'complete', 'generation')
+
+    def __init__(self):
+        self.entries = []
+        self.loaded = False
+        # True - guruhning barcha tirik xabarlari xotirada (DB da chuqurroq sahifa yo'q)
+        self.complete = True
+        self.generation = 0
+
+
+class RecentMessages:
+    """Har bir guruh uchun hajmi cheklangan so'nggi xabarlar halqasi (ring buffer)
+
+    Yuborishda to'ldiriladi, o'chirish va muddat tugashida tozalanadi, ishga tushishda DB dan
+    isitiladi. Tarixning birinchi sahifasi xotiradan beriladi; DB faqat chuqurroq (cursor/before)
+    sahifalar uchun. Boshqa workerlardagi o'zgarishlar bus orqali keladi - bus jarayonlararo
+    bo'lmasa (message_bus.shared=False) halqalar ishlatilmaydi, tarix doim DB dan.
+    """
+
+    def __init__(self):
+        self.size = 100
+        self.enabled = True
+        self._rings = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.size = max(app.config.get('RECENT_MESSAGES_SIZE', 100),
+                        app.config.get('MESSAGE_PAGE_MAX', 100))
+        self.enabled = message_bus.shared
+        message_bus.subscribe('history.add', self._add)
+        message_bus.subscribe('history.remove', self._remove)
+        message_bus.subscribe('history.image', self._set_image)
+        message_bus.subscribe('history.drop', self._drop)
+
+    def add(self, values, author=None, encoded=None, image_pending=False):
+        """Yangi xabar (writer values yoki Message); encoded - hodisa uchun tayyorlangan baytlar
+
+        image_pending - rasm tayyor bo'lguncha; set_image bilan yakunlanadi.
+        """
+        if not self.enabled:
+            return
+        payload = {field: _get(values, field) for field in FIELDS}
+        payload['image_pending'] = image_pending
+        payload['created_at'] = payload['created_at'].isoformat()
+        payload['expires_at'] = payload['expires_at'].isoformat()
+        # Shu worker darhol (tayyor baytlar bilan), qolganlari bus orqali
+        entry = self._add(payload)
+        if entry is not None and encoded is not None:
+            entry.encoded = ((upload_urls.window(), author), encoded)
+        message_bus.publish('history.add', payload)
+
+    def remove(self, group_id, message_ids):
+        payload = {'group_id': group_id, 'message_ids': list(message_ids)}
+        self._remove(payload)
+        message_bus.publish('history.remove', payload)
+
+    def set_image(self, group_id, message_id, image_url):
+        """Rasm qayta ishlanib bo'lganda (image_url=None - xatolik)"""
+        payload = {'group_id': group_id, 'message_id': message_id, 'image_url': image_url}
+        self._set_image(payload)
+        message_bus.publish('history.image', payload)
+
+    def drop(self, group_id):
+        """Guruh o'chirilganda"""
+        payload = {'group_id': group_id}
+        self._drop(payload)
+        message_bus.publish('history.drop', payload)
+
+    def page(self, group_id, limit, now=None):
+        """Birinchi sahifa (yangidan eskiga); xotirada yetarli bo'lmasa None"""
+        if not self.enabled:
+            return None
+        now = now or datetime.utcnow()
+        ring = self._rings.get(group_id)
+        if ring is None or not ring.loaded:
+            ring = self._load(group_id, now)
+
+        with self._lock:
+            # Muddat bir xil - eng eskilari boshida turadi
+            expired = 0
+            while expired < len(ring.entries) and ring.entries[expired].expires_at <= now:
+                expired += 1
+            del ring.entries[:expired]
+
+            if ring.loaded and (len(ring.entries) > limit or ring.complete):
+                self.hits += 1
+                entries = ring.entries[-(limit + 1):]
+                entries.reverse()
+                return entries[:limit], len(entries) > limit
+
+        self.misses += 1
+        return None
+
+    def warm(self):
+        """Ishga tushishda barcha guruhlarning tirik xabarlarini bitta so'rov bilan yuklash"""
+        if not self.enabled:
+            return 0
+        now = datetime.utcnow()
+        rows = db.session.execute(self._query(now).order_by(Message.created_at, Message.id)).all()
+
+        by_group = {}
+        for row in rows:
+            by_group.setdefault(row.group_id, []).append(_entry(row))
+
+        with self._lock:
+            for group_id, entries in by_group.items():
+                self._merge(self._rings.setdefault(group_id, Ring()), entries, len(entries))
+        return len(rows)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'groups': len(self._rings),
+            'messages': sum(len(ring.entries) for ring in list(self._rings.values())),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def _query(self, now):
+        return select(*(getattr(Message, field) for field in FIELDS)).filter(
+            Message.is_deleted == False,
+            Message.expires_at > now
+        )
+
+    def _load(self, group_id, now):
+        """Guruh halqasini DB dan to'ldirish (hali yozilmagan, bus orqali kelganlari saqlanadi)"""
+        with self._lock:
+            ring = self._rings.setdefault(group_id, Ring())
+            generation = ring.generation
+
+        rows = db.session.execute(self._query(now).filter(Message.group_id == group_id).order_by(
+            Message.created_at.desc(), Message.id.desc()
+        ).limit(self.size + 1)).all()
+
+        with self._lock:
+            # Yuklash paytida o'chirilgan xabar qaytib kelmasligi uchun - keyingi so'rovda qayta
+            if ring.generation == generation and not ring.loaded:
+                self._merge(ring, [_entry(row) for row in reversed(rows)], len(rows))
+        return ring
+
+    def _merge(self, ring, entries, total):
+        known = {entry.id for entry in ring.entries}
+        for entry in entries:
+            if entry.id not in known:
+                insort(ring.entries, entry)
+        ring.complete = total <= self.size and len(ring.entries) <= self.size
+        self._trim(ring)
+        ring.loaded = True
+
+    def _trim(self, ring):
+        if len(ring.entries) > self.size:
+            del ring.entries[:len(ring.entries) - self.size]
+            ring.complete = False
+
+    def _add(self, payload):
+        entry = RecentMessage.from_payload(payload)
+        with self._lock:
+            # Yuklanmagan guruh uchun ham saqlanadi: DB ga hali yozilmagan bo'lishi mumkin
+            ring = self._rings.setdefault(entry.group_id, Ring())
+            if any(existing.id == entry.id for existing in ring.entries):
+                return None
+            insort(ring.entries, entry)
+            self._trim(ring)
+        return entry
+
+    def _remove(self, payload):
+        message_ids = set(payload['message_ids'])
+        with self._lock:
+            ring = self._rings.get(payload['group_id'])
+            if ring is None:
+                return
+            ring.generation += 1
+            ring.entries = [entry for entry in ring.entries if entry.id not in message_ids]
+
+    def _set_image(self, payload):
+        with self._lock:
+            ring = self._rings.get(payload['group_id'])
+            for entry in ring.entries if ring else ():
+                if entry.id == payload['message_id']:
+                    entry.image_url = payload['image_url']
+                    entry.image_pending = False
+                    entry.encoded = None
+
+    def _drop(self, payload):
+        with self._lock:
+            self._rings.pop(payload['group_id'], None)
+
+
+def _get(values, field):
+    return values.get(field) if isinstance(values, dict) else getattr(values, field)
+
+
+def _entry(row):
+    return RecentMessage(*(getattr(row, field) for field in FIELDS))
+
+
+recent_messages = RecentMessages()
@@ -0,0 +1,352 @@
+import glob
+import hashlib
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+from PIL import Image, UnidentifiedImageError
+
+from models import UploadBlob
+from uploads import upload_urls
+
+try:
+    from eventlet import tpool
+except ImportError:
+    tpool = None
+
+# Content-addressed rasmlar papkasi (UPLOAD_FOLDER ichida)
+CAS_FOLDER = 'cas'
+
+# Renditionlari bilan saqlangan rasm kaliti oxiri: <digest>-400x400-r
+RENDITION_SUFFIX = '-r'
+
+# Magic baytlar -> (Pillow formati, kengaytma); fayl nomidagi kengaytmaga ishonilmaydi
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'PNG', 'png'),
+    (b'\xff\xd8\xff', 'JPEG', 'jpg'),
+    (b'GIF87a', 'GIF', 'gif'),
+    (b'GIF89a', 'GIF', 'gif'),
+)
+
+INGEST_CHUNK = 64 * 1024
+
+# Rendition formatlari: Pillow nomi -> (kengaytma, MIME turi, sifat)
+RENDITION_FORMATS = {
+    'AVIF': ('avif', 'image/avif', 60),
+    'WEBP': ('webp', 'image/webp', 80),
+    'JPEG': ('jpg', 'image/jpeg', 80),
+}
+
+
+def is_stored(url):
+    """URL content-addressed store ga tegishlimi (havolalar sanaladi)"""
+    return url.startswith(f'uploads/{CAS_FOLDER}/')
+
+
+def local_path(upload_folder, url):
+    """uploads/... URL ni diskdagi yo'lga aylantirish"""
+    return os.path.join(upload_folder, url.split('/', 1)[1])
+
+
+class InvalidImage(ValueError):
+    """Yuklangan fayl ruxsat etilgan rasm emas yoki juda katta"""
+
+
+def sniff_format(head):
+    """Fayl boshidagi baytlardan (format, kengaytma) aniqlash"""
+    for magic, image_format, ext in SIGNATURES:
+        if head.startswith(magic):
+            return image_format, ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP', 'webp'
+    return None, None
+
+
+def ingest(stream, allowed_extensions, max_pixels, spool_size):
+    """So'rov tanasini spooled temp faylga oqim bilan ko'chirish va tekshirish (native threadda)
+
+    Faqat rasm sarlavhasi o'qiladi: o'lcham piksel limitidan oshsa, dekodlashgacha rad etiladi.
+    (spool, sha256, format, kengaytma) qaytaradi.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    try:
+        digest = hashlib.sha256()
+        while True:
+            chunk = stream.read(INGEST_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            spool.write(chunk)
+
+        spool.seek(0)
+        image_format, ext = sniff_format(spool.read(16))
+        if image_format is None or ext not in allowed_extensions:
+            raise InvalidImage('Faqat rasm fayllari ruxsat etilgan')
+
+        spool.seek(0)
+        try:
+            with Image.open(spool, formats=[image_format]) as img:
+                width, height = img.size
+        except Image.DecompressionBombError:
+            raise InvalidImage('Rasm o\'lchami juda katta')
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise InvalidImage('Rasm fayli buzilgan')
+        if width * height > max_pixels:
+            raise InvalidImage('Rasm o\'lchami juda katta')
+
+        spool.seek(0)
+        return spool, digest.hexdigest(), image_format, ext
+    except Exception:
+        spool.close()
+        raise
+
+
+def rendition_path(path, size, image_format):
+    """uploads/cas/ab/<key>.png -> uploads/cas/ab/<key>@200.webp (URL yoki disk yo'li)"""
+    return f'{os.path.splitext(path)[0]}@{size}.{RENDITION_FORMATS[image_format][0]}'
+
+
+def supported_formats(preferred):
+    """Pillow yoza oladigan rendition formatlari (masalan AVIF plagin bilan)"""
+    Image.init()
+    return tuple(fmt for fmt in preferred if fmt in RENDITION_FORMATS and fmt in Image.SAVE)
+
+
+def remove_file(path):
+    """Faylni o'chirish, bo'shatilgan baytlar sonini qaytaradi"""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except OSError:
+        return 0
+    return size
+
+
+def remove_upload(upload_folder, url):
+    """Yuklangan rasm va uning renditionlarini o'chirish"""
+    path = local_path(upload_folder, url)
+    size = remove_file(path)
+    if is_stored(url):
+        for rendition in glob.glob(glob.escape(os.path.splitext(path)[0]) + '@*'):
+            size += remove_file(rendition)
+    return size
+
+
+def max_size_for(folder):
+    """Papka bo'yicha maksimal o'lcham"""
+    if folder == 'avatars':
+        return (200, 200)
+    elif folder.startswith('group'):
+        return (400, 400)
+    return (800, 800)
+
+
+def _flatten(img):
+    if img.mode in ('RGBA', 'LA'):
+        # Convert to RGB for JPEG
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        return rgb_img
+    return img
+
+
+def _save(img, filepath, image_format, **params):
+    # Parallel yozuvchilar yarim fayl ko'rmasligi uchun vaqtinchalik faylga
+    tmp_path = f'{filepath}.{secrets.token_hex(4)}.tmp'
+    img.save(tmp_path, image_format, **params)
+    os.replace(tmp_path, filepath)
+
+
+def render_image(source, filepath, max_size, renditions=(), formats=()):
+    """Rasmni kichraytirish va saqlash, kerak bo'lsa renditionlar bilan (native threadda ishlaydi)"""
+    img = Image.open(source)
+    if img.format == 'JPEG':
+        # DCT bosqichida 1/2, 1/4, 1/8 masshtabda dekodlash - to'liq o'lcham xotiraga olinmaydi
+        target = max(max_size)
+        img.draft('RGB', (target, target))
+    img = _flatten(img)
+
+    # Kattasidan kichigiga: har bir o'lcham oldingisidan kichraytiriladi
+    rendition = img if img.mode == 'RGB' else img.convert('RGB')
+    for size in sorted(renditions, reverse=True):
+        rendition = rendition.copy()
+        rendition.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for image_format in formats:
+            _save(rendition, rendition_path(filepath, size, image_format), image_format,
+                  quality=RENDITION_FORMATS[image_format][2])
+
+    # Asosiy rasm oxirida yoziladi - u mavjud bo'lsa, renditionlar ham tayyor
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    # Save with optimization
+    image_format = Image.registered_extensions().get(os.path.splitext(filepath)[1])
+    _save(img, filepath, image_format, optimize=True, quality=85)
+
+
+class ImageUpload:
+    """Qayta ishlanishi kutilayotgan yuklangan rasm"""
+
+    __slots__ = ('data', 'filepath', 'max_size', 'url', 'renditions', 'needs_processing')
+
+    def __init__(self, data, filepath, max_size, url, renditions=(), needs_processing=True):
+        self.data = data
+        self.filepath = filepath
+        self.max_size = max_size
+        self.url = url
+        self.renditions = renditions
+        self.needs_processing = needs_processing
+
+
+class ImagePipeline:
+    """Pillow ishini eventlet hubidan tashqarida (tpool) bajarish"""
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.upload_folder = None
+        self._slots = threading.BoundedSemaphore(4)
+        self.rendition_sizes = ()
+        self.rendition_formats = ()
+        self.allowed_extensions = set()
+        self.max_pixels = 0
+        self.spool_size = 0
+        self.queued = 0
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self.dedup_hits = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self._slots = threading.BoundedSemaphore(app.config.get('IMAGE_WORKERS', 4))
+        self.rendition_sizes = tuple(app.config.get('RENDITION_SIZES', ()))
+        self.rendition_formats = supported_formats(app.config.get('RENDITION_FORMATS', ('JPEG',)))
+        self.allowed_extensions = set(app.config['ALLOWED_EXTENSIONS'])
+        self.max_pixels = app.config.get('MAX_IMAGE_PIXELS', 40_000_000)
+        self.spool_size = app.config.get('UPLOAD_SPOOL_SIZE', 1024 * 1024)
+
+    def _offload(self, func, *args):
+        if tpool is not None:
+            return tpool.execute(func, *args)
+        return func(*args)
+
+    def rendition_sizes_for(self, max_size):
+        """Asosiy rasmdan katta bo'lmagan rendition o'lchamlari"""
+        return tuple(size for size in self.rendition_sizes if size <= max(max_size))
+
+    def prepare(self, image, folder, renditions=False):
+        """So'rov ichida: faylni tekshirib, hash bo'yicha yakuniy URL ni belgilash
+
+        renditions=True - srcset uchun kichik nusxalar ham yaratiladi (faqat xabar rasmlari).
+        Ruxsat etilmagan yoki juda katta rasm uchun InvalidImage.
+        Bir xil rasm shu o'lcham profili bilan avval saqlangan bo'lsa, qayta ishlanmaydi.
+        UploadBlob havolasi joriy sessiyaga qo'shiladi - commit chaqiruvchida.
+        """
+        _, f_ext = os.path.splitext(image.filename or '')
+        if f_ext[1:].lower() not in self.allowed_extensions:
+            raise InvalidImage('Faqat rasm fayllari ruxsat etilgan')
+
+        spool, digest, _, ext = self._offload(ingest, image.stream, self.allowed_extensions,
+                                              self.max_pixels, self.spool_size)
+        max_size = max_size_for(folder)
+        sizes = self.rendition_sizes_for(max_size) if renditions else ()
+        key = f'{digest}-{max_size[0]}x{max_size[1]}'
+        if sizes:
+            # Alohida blob: xuddi shu rasm shu o'lchamda renditionlarsiz (avatar) saqlangan bo'lishi mumkin
+            key += RENDITION_SUFFIX
+        try:
+            url, is_ready = UploadBlob.acquire(key, f'uploads/{CAS_FOLDER}/{digest[:2]}/{key}.{ext}')
+        except Exception:
+            spool.close()
+            raise
+
+        filepath = local_path(self.upload_folder, url)
+        if is_ready:
+            spool.close()
+            self.dedup_hits += 1
+            return ImageUpload(None, filepath, max_size, url, sizes, needs_processing=False)
+
+        # Create folder if not exists
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        return ImageUpload(spool, filepath, max_size, url, sizes)
+
+    def process(self, upload):
+        """Natijani kutish (greenthread kutadi, hub bloklanmaydi)"""
+        if not upload.needs_processing:
+            return
+
+        started = time.monotonic()
+        self.queued += 1
+        with self._slots:
+            self.queued -= 1
+            self.active += 1
+            try:
+                self._offload(render_image, upload.data, upload.filepath, upload.max_size,
+                              upload.renditions, self.rendition_formats)
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.active -= 1
+                upload.data.close()
+                upload.data = None
+
+        UploadBlob.mark_ready(upload.url)
+        self.processed += 1
+        self.last_latency = time.monotonic() - started
+        self.total_latency += self.last_latency
+
+    def renditions(self, url):
+        """srcset uchun renditionlar: [{type: MIME turi, sizes: {o'lcham: imzolangan URL}}], afzallik tartibida"""
+        if not url or not is_stored(url):
+            return None
+        stem = os.path.splitext(url)[0]
+        if not stem.endswith(RENDITION_SUFFIX):
+            return None
+        # .../<digest>-400x400-r -> (400, 400)
+        width, height = stem[:-len(RENDITION_SUFFIX)].rsplit('-', 1)[1].split('x')
+        sizes = self.rendition_sizes_for((int(width), int(height)))
+        if not sizes:
+            return None
+        return [{
+            'type': RENDITION_FORMATS[image_format][1],
+            'sizes': {
+                size: upload_urls.sign(rendition_path(url, size, image_format))
+                for size in sizes
+            }
+        } for image_format in self.rendition_formats]
+
+    def submit(self, upload, callback):
+        """Fonda qayta ishlash; tugagach callback(ok) app context ichida chaqiriladi"""
+        self.socketio.start_background_task(self._run, upload, callback)
+
+    def _run(self, upload, callback):
+        with self.app.app_context():
+            try:
+                self.process(upload)
+                ok = True
+            except Exception as e:
+                print(f"Rasmni qayta ishlashda xatolik: {e}")
+                ok = False
+
+            callback(ok)
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'active': self.active,
+            'processed': self.processed,
+            'failed': self.failed,
+            'dedup_hits': self.dedup_hits,
+            'last_latency': self.last_latency,
+            'avg_latency': self.total_latency / self.processed if self.processed else 0.0,
+        }
+
+
+image_pipeline = ImagePipeline()
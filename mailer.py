@@ -0,0 +1,140 @@
+import queue
+import smtplib
+
+from flask_mail import Mail, BadHeaderError
+
+
+class Mailer:
+    """Chiquvchi email navbati: cheklangan workerlar, qayta ishlatiladigan SMTP ulanish, retry/backoff
+
+    Har bir worker bitta SMTP (TLS) ulanishini ochiq tutadi va navbatdagi xatlarni shu ulanish
+    orqali ketma-ket yuboradi; MAIL_IDLE_TIMEOUT davomida xat bo'lmasa yoki MAIL_BATCH_SIZE
+    ta xat yuborilgach ulanish yopiladi. Vaqtinchalik xatolikda xat kechiktirib qayta yuboriladi.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.mail = None
+        self._queue = queue.Queue()
+        self._started = False
+        self.workers = 2
+        self.batch_size = 50
+        self.idle_timeout = 30
+        self.retries = 3
+        self.backoff = 2
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.connections = 0
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.mail = Mail(app)
+        self._queue = queue.Queue(app.config.get('MAIL_QUEUE_MAX', 1000))
+        self.workers = app.config.get('MAIL_WORKERS', 2)
+        self.batch_size = app.config.get('MAIL_BATCH_SIZE', 50)
+        self.idle_timeout = app.config.get('MAIL_IDLE_TIMEOUT', 30)
+        self.retries = app.config.get('MAIL_RETRIES', 3)
+        self.backoff = app.config.get('MAIL_RETRY_BACKOFF', 2)
+
+    def send(self, message):
+        """Xatni navbatga qo'yish; navbat to'lgan bo'lsa False"""
+        if not self._started:
+            self._started = True
+            for _ in range(self.workers):
+                self.socketio.start_background_task(self._worker)
+        try:
+            self._queue.put_nowait((message, 0))
+        except queue.Full:
+            print("Email navbati to'lgan, xat yuborilmadi")
+            return False
+        return True
+
+    def _worker(self):
+        with self.app.app_context():
+            while True:
+                item = self._queue.get()
+                connection = None
+                delivered = 0
+                # Navbatda xat bor ekan (idle_timeout gacha kutib) shu ulanishdan foydalaniladi
+                while item is not None and delivered < self.batch_size:
+                    if connection is None:
+                        try:
+                            connection = self._connect()
+                        except Exception as e:
+                            print(f"SMTP ulanishida xatolik: {e}")
+                            self._retry(*item)
+                            break
+                    if not self._deliver(connection, *item):
+                        connection = self._close(connection)
+                    delivered += 1
+                    if delivered < self.batch_size:
+                        try:
+                            item = self._queue.get(timeout=self.idle_timeout)
+                        except queue.Empty:
+                            item = None
+                self._close(connection)
+
+    def _connect(self):
+        connection = self.mail.connect()
+        connection.__enter__()
+        self.connections += 1
+        return connection
+
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
+
+    def _deliver(self, connection, message, attempt):
+        """Bitta xat; ulanish yaroqsiz bo'lib qolsa False"""
+        try:
+            connection.send(message)
+        except (BadHeaderError, AssertionError, smtplib.SMTPRecipientsRefused) as e:
+            # Qayta urinish foyda bermaydi
+            print(f"Email yuborilmadi ({message.recipients}): {e}")
+            self.failed += 1
+            return True
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code >= 500:
+                print(f"Email yuborilmadi ({message.recipients}): {e}")
+                self.failed += 1
+                return True
+            self._retry(message, attempt)
+            return False
+        except (smtplib.SMTPException, OSError) as e:
+            print(f"SMTP xatolik (qayta uriniladi): {e}")
+            self._retry(message, attempt)
+            return False
+        self.sent += 1
+        return True
+
+    def _retry(self, message, attempt):
+        if attempt >= self.retries:
+            print(f"Email {attempt + 1} urinishdan keyin ham yuborilmadi: {message.recipients}")
+            self.failed += 1
+            return
+        self.retried += 1
+        self.socketio.start_background_task(self._requeue, message, attempt + 1,
+                                            self.backoff * 2 ** attempt)
+
+    def _requeue(self, message, attempt, delay):
+        self.socketio.sleep(delay)
+        self._queue.put((message, attempt))
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'connections': self.connections,
+        }
+
+
+mailer = Mailer()
@@ -1,10 +1,23 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
+from sqlalchemy import select, tuple_
 from datetime import datetime, timedelta
+from functools import partial
+import base64
+import binascii
 import os
 
-from models import db, Message, Group, GroupMember
-from utils import save_image, delete_image
+from models import db, read, Message, User
+from utils import release_image
+from cache import membership_cache
+from bus import message_bus
+from images import image_pipeline, InvalidImage
+from uploads import upload_urls
+from expiry import expiry_scheduler, image_reaper
+from writer import message_writer
+from serializers import dumps, message_payload, json_response, encode_page
+from history import recent_messages
+from ratelimit import rate_limiter
 
 messages_bp = Blueprint('messages', __name__)
 
@@ -12,60 +25,150 @@ messages_bp = Blueprint('messages', __name__)
 @login_required
 def send_message(group_id):
     """Xabar yuborish"""
-    group = Group.query.get_or_404(group_id)
+    content = request.form.get('content', '').strip()
+    client_id = request.form.get('client_id') or None
+    file = request.files.get('image')
+    has_image = bool(file and file.filename)
     
-    # Check if user is member
-    if not group.is_member(current_user):
-        return jsonify({'error': 'Siz bu guruh a\'zosi emassiz'}), 403
+    error = check_message(group_id, content, client_id, has_image)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
     
-    content = request.form.get('content', '').strip()
+    # Qayta yuborilgan so'rov - mavjud xabar qaytariladi
+    if client_id:
+        sent = message_writer.find_sent(current_user.id, client_id)
+        if sent:
+            return jsonify(message_ack(sent, duplicate=True))
     
-    # Handle image upload
+    # Handle image upload (rasm fonda qayta ishlanadi)
     image_url = None
-    if 'image' in request.files:
-        file = request.files['image']
-        if file and file.filename:
-            filename = save_image(file, f'group_{group_id}_images')
-            if filename:
-                image_url = filename
-    
-    if not content and not image_url:
-        return jsonify({'error': 'Xabar yoki rasm yuborishingiz kerak'}), 400
-    
-    # Create message (expires in 10 minutes)
-    message = Message(
+    upload = None
+    if has_image:
+        try:
+            upload = image_pipeline.prepare(file, f'group_{group_id}_images', renditions=True)
+        except InvalidImage as e:
+            return jsonify({'error': str(e)}), 400
+        image_url = upload.url
+        # Rasm havolasi (UploadBlob) xabardan oldin saqlanadi
+        db.session.commit()
+    
+    # Create message (expires in 10 minutes); DB ga fonda, partiya bilan yoziladi
+    message = message_writer.submit(
         user_id=current_user.id,
         group_id=group_id,
         content=content,
         image_url=image_url,
+        client_id=client_id,
         expires_at=datetime.utcnow() + timedelta(seconds=600)
     )
+    if message.duplicate:
+        # Parallel qayta yuborish birinchi bo'lib yetib keldi
+        orphans = release_image(image_url, f'group_{group_id}_images')
+        db.session.commit()
+        image_reaper.submit(orphans)
+        return jsonify(message_ack(message, duplicate=True))
     
-    db.session.add(message)
-    db.session.commit()
+    expiry_scheduler.schedule(message.expires_at)
     
-    # Emit via Socket.IO
-    from app import socketio
-    socketio.emit('new_group_message', {
-        'id': message.id,
-        'user': current_user.username,
-        'user_id': current_user.id,
-        'content': content,
-        'image_url': image_url,
-        'created_at': message.created_at.isoformat(),
-        'expires_at': message.expires_at.isoformat(),
-        'group_id': group_id
-    }, room=f'group_{group_id}')
+    # Avval saqlangan (bir xil) rasm qayta ishlanmaydi
+    image_pending = upload is not None and upload.needs_processing
+    if image_pending:
+        image_pipeline.submit(upload, partial(image_processed, message, group_id, image_url))
     
-    return jsonify({
+    # Bitta ko'rinish: hodisa (xona uchun bir marta kodlanadi), javob va tarix
+    payload = message_payload(message, current_user, group_id, client_id, image_pending)
+    remember(message, payload, image_pending)
+    
+    # Emit via Socket.IO (barcha workerlarga)
+    message_bus.emit('new_group_message', payload, room=f'group_{group_id}')
+    
+    return jsonify(message_ack(message, payload))
+
+def send_group_message(data):
+    """Socket.IO orqali xabar yuborish (HTTP so'rovsiz, faqat matn); ack lug'atini qaytaradi"""
+    try:
+        group_id = int(data.get('group_id'))
+    except (TypeError, ValueError):
+        return {'error': 'Noto\'g\'ri guruh'}
+    content = data.get('content')
+    content = content.strip() if isinstance(content, str) else ''
+    client_id = data.get('client_id') or None
+    
+    error = check_message(group_id, content, client_id)
+    if error:
+        return {'error': error[0]}
+    
+    # Darhol tarqatiladi; DB ga boshqa xabarlar bilan bitta commitda yoziladi
+    message = message_writer.submit(
+        user_id=current_user.id,
+        group_id=group_id,
+        content=content,
+        client_id=client_id,
+        expires_at=datetime.utcnow() + timedelta(seconds=600)
+    )
+    
+    if message.duplicate:
+        return message_ack(message, duplicate=True)
+    
+    expiry_scheduler.schedule(message.expires_at)
+    payload = message_payload(message, current_user, group_id, client_id)
+    remember(message, payload)
+    message_bus.emit('new_group_message', payload, room=f'group_{group_id}')
+    
+    return message_ack(message, payload)
+
+def check_message(group_id, content, client_id=None, has_image=False):
+    """HTTP va Socket.IO yuborish uchun umumiy tekshiruv; (xato, status) yoki None"""
+    if rate_limiter.hit('message', current_user.id):
+        return 'Juda ko\'p xabar yuborildi, biroz kuting', 429
+    
+    # Check if user is member (keshdan, guruh mavjudligini ham bildiradi)
+    if not membership_cache.is_member(group_id, current_user.id):
+        return 'Siz bu guruh a\'zosi emassiz', 403
+    
+    if client_id is not None and (not isinstance(client_id, str) or len(client_id) > 64):
+        return 'Noto\'g\'ri client_id', 400
+    
+    if not content and not has_image:
+        return 'Xabar yoki rasm yuborishingiz kerak', 400
+    
+    return None
+
+def remember(message, payload, image_pending=False):
+    """Xabarni tarix halqasiga qo'shish (hodisa ko'rinishi baytlari qayta ishlatiladi)
+
+    Rasm hali tayyor bo'lmasa, tarix ham joy egallovchini ko'rsatadi - image_processed yakunlaydi.
+    """
+    author = current_user._get_current_object()
+    recent_messages.add(message.values, author, dumps(payload), image_pending)
+
+def message_ack(message, payload=None, duplicate=False):
+    """Yuboruvchiga javob (HTTP va Socket.IO ack); payload - tarqatilgan xabar ko'rinishi"""
+    return {
         'success': True,
-        'message': {
-            'id': message.id,
-            'content': content,
-            'image_url': image_url,
-            'created_at': message.created_at.isoformat()
-        }
-    })
+        'duplicate': duplicate,
+        'message': payload or message_payload(message, current_user, message.group_id, message.client_id)
+    }
+
+def image_processed(message, group_id, image_url, ok):
+    """Rasm tayyor bo'lganda (yoki xatolikda) guruhga xabar berish"""
+    if not ok:
+        # Xabar hali navbatda bo'lishi mumkin
+        message.wait(timeout=5)
+        Message.query.filter_by(id=message.id).update({'image_url': None})
+        orphans = release_image(image_url, f'group_{group_id}_images')
+        db.session.commit()
+        image_reaper.submit(orphans)
+    recent_messages.set_image(group_id, message.id, image_url if ok else None)
+    
+    message_bus.emit('group_message_image', {
+        'message_id': message.id,
+        'group_id': group_id,
+        'image_url': image_url if ok else None,
+        'image_src': upload_urls.sign(image_url) if ok else None,
+        'image_renditions': image_pipeline.renditions(image_url) if ok else None,
+        'status': 'ready' if ok else 'failed'
+    }, room=f'group_{group_id}')
 
 @messages_bp.route('/messages/<int:message_id>', methods=['DELETE'])
 @login_required
@@ -73,26 +176,20 @@ def delete_message(message_id):
     """Xabarni o'chirish"""
     message = Message.query.get_or_404(message_id)
     
-    # Check permissions
-    member = GroupMember.query.filter_by(
-        group_id=message.group_id,
-        user_id=current_user.id
-    ).first()
-    
     # User can delete their own messages or if they have manage permissions
-    if message.user_id != current_user.id and (not member or not member.can_manage_messages()):
+    if message.user_id != current_user.id and not membership_cache.can_manage(message.group_id, current_user.id):
         return jsonify({'error': 'Bu xabarni o\'chirishga ruxsat yo\'q'}), 403
     
-    # Delete image if exists
-    if message.image_url:
-        delete_image(message.image_url, f'group_{message.group_id}_images')
+    # Rasm havolasi shu tranzaksiyada bo'shatiladi, fayl commit dan keyin o'chiriladi
+    orphans = release_image(message.image_url, f'group_{message.group_id}_images')
     
     db.session.delete(message)
     db.session.commit()
+    image_reaper.submit(orphans)
+    recent_messages.remove(message.group_id, [message_id])
     
     # Emit deletion event
-    from app import socketio
-    socketio.emit('delete_group_message', {
+    message_bus.emit('delete_group_message', {
         'message_id': message_id,
         'group_id': message.group_id
     }, room=f'group_{message.group_id}')
@@ -106,52 +203,86 @@ def get_message(message_id):
     message = Message.query.get_or_404(message_id)
     
     # Check if user has access to the group
-    if not message.group.is_member(current_user):
+    if not membership_cache.is_member(message.group_id, current_user.id):
         return jsonify({'error': 'Ruxsat yo\'q'}), 403
     
-    return jsonify({
-        'id': message.id,
-        'user': message.user.username,
-        'user_id': message.user_id,
-        'content': message.content,
-        'image_url': message.image_url,
-        'created_at': message.created_at.isoformat(),
-        'expires_at': message.expires_at.isoformat(),
-        'group_id': message.group_id
-    })
+    return jsonify(message_payload(message, message.user, message.group_id, message.client_id))
 
 @messages_bp.route('/groups/<int:group_id>/messages')
 @login_required
 def get_messages(group_id):
-    """Guruh xabarlarini olish"""
-    group = Group.query.get_or_404(group_id)
-    
+    """Guruh xabarlarini olish (keyset pagination)"""
     # Check if user is member
-    if not group.is_member(current_user):
+    if not membership_cache.is_member(group_id, current_user.id):
         return jsonify({'error': 'Ruxsat yo\'q'}), 403
     
-    # Cleanup expired messages first
-    Message.cleanup_expired()
+    limit = request.args.get('limit', current_app.config['MESSAGE_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['MESSAGE_PAGE_MAX']))
     
-    limit = request.args.get('limit', 50, type=int)
-    before = request.args.get('before')
+    # Birinchi sahifa - xotiradagi so'nggi xabarlardan (DB ga murojaatsiz)
+    if not request.args.get('cursor') and not request.args.get('before', type=int):
+        recent = recent_messages.page(group_id, limit)
+        if recent is not None:
+            entries, has_more = recent
+            last = entries[-1] if has_more else None
+            # Oldindan kodlangan baytlardan (har bir xabar bir marta kodlanadi)
+            return json_response(encode_page(
+                [entry.encode() for entry in entries if entry.user is not None],
+                encode_cursor(last.created_at, last.id) if last else None
+            ))
     
-    query = Message.query.filter_by(
-        group_id=group_id,
-        is_deleted=False
+    # Faqat kerakli ustunlar, muallif bilan bitta JOIN (o'quvchi pool orqali)
+    query = select(
+        Message.id,
+        Message.user_id,
+        Message.content,
+        Message.image_url,
+        Message.created_at,
+        Message.expires_at,
+        User.username,
+        User.avatar
+    ).join(User, User.id == Message.user_id).filter(
+        Message.group_id == group_id,
+        Message.is_deleted == False,
+        # Muddati o'tgan, lekin hali o'chirilmagan xabarlarni ko'rsatmaslik
+        Message.expires_at > datetime.utcnow()
     )
     
-    if before:
-        query = query.filter(Message.id < int(before))
+    position = None
+    if request.args.get('cursor'):
+        position = decode_cursor(request.args['cursor'])
+        if position is None:
+            return jsonify({'error': 'Noto\'g\'ri cursor'}), 400
+    elif request.args.get('before', type=int):
+        # Eski klientlar uchun: before=<message_id>
+        position = read(select(Message.created_at, Message.id).filter(
+            Message.id == request.args.get('before', type=int)
+        )).first()
+    
+    if position:
+        query = query.filter(tuple_(Message.created_at, Message.id) < tuple_(*position))
     
-    messages = query.order_by(Message.created_at.desc()).limit(limit).all()
+    rows = read(query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)).all()
     
-    return jsonify([{
-        'id': msg.id,
-        'user': msg.user.username,
-        'user_avatar': msg.user.avatar,
-        'content': msg.content,
-        'image_url': msg.image_url,
-        'created_at': msg.created_at.isoformat(),
-        'expires_at': msg.expires_at.isoformat()
-    } for msg in messages])
\ No newline at end of file
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    return jsonify({
+        'messages': [message_payload(row, row, group_id) for row in rows],
+        'next_cursor': next_cursor
+    })
+
+def encode_cursor(created_at, message_id):
+    """(created_at, id) juftligini shaffof bo'lmagan cursor ga aylantirish"""
+    raw = f'{created_at.isoformat()}|{message_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, message_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return None
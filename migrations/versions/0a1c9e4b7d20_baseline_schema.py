@@ -0,0 +1,116 @@
+"""baseline schema
+
+Revision ID: 0a1c9e4b7d20
+Revises: 
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a1c9e4b7d20'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    # Migratsiyalardan oldingi sxema: bo'sh bazada `flask db upgrade` shu yerdan boshlanadi,
+    # db.create_all() bilan yaratilgan bazalarda jadvallar allaqachon mavjud
+    if not _has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=80), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password_hash', sa.String(length=200), nullable=False),
+            sa.Column('avatar', sa.String(length=200), nullable=True),
+            sa.Column('bio', sa.Text(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('is_online', sa.Boolean(), nullable=True),
+            sa.Column('last_seen', sa.DateTime(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email'),
+            sa.UniqueConstraint('username')
+        )
+    if not _has_table('groups'):
+        op.create_table(
+            'groups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('avatar', sa.String(length=200), nullable=True),
+            sa.Column('owner_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('is_private', sa.Boolean(), nullable=True),
+            sa.Column('invite_code', sa.String(length=50), nullable=True),
+            sa.ForeignKeyConstraint(['owner_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('invite_code')
+        )
+    if not _has_table('group_members'):
+        op.create_table(
+            'group_members',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('group_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('role', sa.String(length=20), nullable=True),
+            sa.Column('joined_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['group_id'], ['groups.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('group_id', 'user_id', name='unique_group_member')
+        )
+    if not _has_table('messages'):
+        op.create_table(
+            'messages',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('group_id', sa.Integer(), nullable=False),
+            sa.Column('content', sa.Text(), nullable=True),
+            sa.Column('image_url', sa.String(length=500), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.Column('is_deleted', sa.Boolean(), nullable=True),
+            sa.ForeignKeyConstraint(['group_id'], ['groups.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_table('password_reset_tokens'):
+        op.create_table(
+            'password_reset_tokens',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('token', sa.String(length=100), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.Column('is_used', sa.Boolean(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('token')
+        )
+    if not _has_table('activity_logs'):
+        op.create_table(
+            'activity_logs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('action', sa.String(length=100), nullable=False),
+            sa.Column('details', sa.Text(), nullable=True),
+            sa.Column('ip_address', sa.String(length=50), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    for table in ('activity_logs', 'password_reset_tokens', 'messages', 'group_members', 'groups', 'users'):
+        if _has_table(table):
+            op.drop_table(table)
@@ -0,0 +1,43 @@
+"""add upload blobs
+
+Revision ID: 3b1d7c9e2a41
+Revises: f644505309f9
+Create Date: 2026-10-17 20:40:12.514803
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1d7c9e2a41'
+down_revision = 'f644505309f9'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    # db.create_all() bilan yaratilgan yangi bazalarda jadval allaqachon mavjud
+    if _has_table('upload_blobs'):
+        return
+    op.create_table(
+        'upload_blobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=100), nullable=False),
+        sa.Column('path', sa.String(length=500), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('is_ready', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key'),
+        sa.UniqueConstraint('path')
+    )
+
+
+def downgrade():
+    if _has_table('upload_blobs'):
+        op.drop_table('upload_blobs')
@@ -0,0 +1,37 @@
+"""add id sequences
+
+Revision ID: 5d9a0e3c6b18
+Revises: 8c2e5f1a7d93
+Create Date: 2026-10-17 21:32:10.648295
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9a0e3c6b18'
+down_revision = '8c2e5f1a7d93'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    # db.create_all() bilan yaratilgan yangi bazalarda jadval allaqachon mavjud
+    if _has_table('id_sequences'):
+        return
+    op.create_table(
+        'id_sequences',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('next_value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    if _has_table('id_sequences'):
+        op.drop_table('id_sequences')
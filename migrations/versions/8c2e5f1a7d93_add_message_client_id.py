@@ -0,0 +1,40 @@
+"""add message client id
+
+Revision ID: 8c2e5f1a7d93
+Revises: 3b1d7c9e2a41
+Create Date: 2026-10-17 21:05:48.301127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2e5f1a7d93'
+down_revision = '3b1d7c9e2a41'
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # db.create_all() bilan yaratilgan yangi bazalarda ustun va indeks allaqachon mavjud
+    if 'client_id' not in _columns('messages'):
+        op.add_column('messages', sa.Column('client_id', sa.String(length=64), nullable=True))
+    if 'ix_messages_client_id' not in _indexes('messages'):
+        op.create_index('ix_messages_client_id', 'messages', ['user_id', 'client_id'], unique=True)
+
+
+def downgrade():
+    if 'ix_messages_client_id' in _indexes('messages'):
+        op.drop_index('ix_messages_client_id', table_name='messages')
+    if 'client_id' in _columns('messages'):
+        with op.batch_alter_table('messages') as batch_op:
+            batch_op.drop_column('client_id')
@@ -0,0 +1,37 @@
+"""add activity log indexes
+
+Revision ID: a7e4c2d91f05
+Revises: 5d9a0e3c6b18
+Create Date: 2026-10-17 22:14:37.512804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e4c2d91f05'
+down_revision = '5d9a0e3c6b18'
+branch_labels = None
+depends_on = None
+
+
+def _indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # db.create_all() bilan yaratilgan yangi bazalarda indekslar allaqachon mavjud
+    existing = _indexes('activity_logs')
+    if 'ix_activity_logs_created_at' not in existing:
+        op.create_index('ix_activity_logs_created_at', 'activity_logs', ['created_at'], unique=False)
+    if 'ix_activity_logs_user_id' not in existing:
+        op.create_index('ix_activity_logs_user_id', 'activity_logs', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    existing = _indexes('activity_logs')
+    if 'ix_activity_logs_user_id' in existing:
+        op.drop_index('ix_activity_logs_user_id', table_name='activity_logs')
+    if 'ix_activity_logs_created_at' in existing:
+        op.drop_index('ix_activity_logs_created_at', table_name='activity_logs')
@@ -0,0 +1,55 @@
+"""add login keys
+
+Revision ID: e3b8f61c4a27
+Revises: a7e4c2d91f05
+Create Date: 2026-10-17 22:48:05.906213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b8f61c4a27'
+down_revision = 'a7e4c2d91f05'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    # db.create_all() bilan yaratilgan yangi bazalarda jadval allaqachon mavjud
+    if not _has_table('login_keys'):
+        op.create_table(
+            'login_keys',
+            sa.Column('key', sa.String(length=120), nullable=False),
+            sa.Column('kind', sa.String(length=10), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('key', 'kind')
+        )
+        op.create_index('ix_login_keys_user_id', 'login_keys', ['user_id'], unique=False)
+
+    # Mavjud foydalanuvchilar uchun kalitlar; faqat harf registri bilan farq qiladigan
+    # takrorlarda birinchi ro'yxatdan o'tgan (kichik id) foydalanuvchi kalitni oladi
+    bind = op.get_bind()
+    login_keys = sa.table('login_keys', sa.column('key'), sa.column('kind'), sa.column('user_id'))
+    existing = {(row.key, row.kind) for row in bind.execute(sa.text('SELECT key, kind FROM login_keys'))}
+    rows = []
+    for user in bind.execute(sa.text('SELECT id, username, email FROM users ORDER BY id')):
+        for kind, value in (('username', user.username), ('email', user.email)):
+            key = (value or '').strip().casefold()
+            if key and (key, kind) not in existing:
+                existing.add((key, kind))
+                rows.append({'key': key, 'kind': kind, 'user_id': user.id})
+    if rows:
+        op.bulk_insert(login_keys, rows)
+
+
+def downgrade():
+    if _has_table('login_keys'):
+        op.drop_index('ix_login_keys_user_id', table_name='login_keys')
+        op.drop_table('login_keys')
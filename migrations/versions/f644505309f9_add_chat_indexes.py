@@ -0,0 +1,41 @@
+"""add chat indexes
+
+Revision ID: f644505309f9
+Revises: 0a1c9e4b7d20
+Create Date: 2026-10-17 20:03:35.179623
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f644505309f9'
+down_revision = '0a1c9e4b7d20'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_messages_group_history', 'messages', ['group_id', 'is_deleted', 'created_at', 'id']),
+    ('ix_messages_expires_at', 'messages', ['expires_at']),
+    ('ix_group_members_user_id', 'group_members', ['user_id']),
+    ('ix_groups_is_private', 'groups', ['is_private', 'created_at']),
+]
+
+
+def _existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # db.create_all() bilan yaratilgan yangi bazalarda indekslar allaqachon mavjud
+    for name, table, columns in INDEXES:
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
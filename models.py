@@ -1,11 +1,44 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
+from sqlalchemy import select, delete, update, tuple_, event
+from sqlalchemy.exc import IntegrityError
+from collections import Counter
+from functools import partial
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 
+from passwords import password_hasher
+
 db = SQLAlchemy()
 
+
+def _apply_pragmas(pragmas, readonly, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    if readonly:
+        cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+
+def init_engines(app):
+    """SQLite ulanishlariga PRAGMA profili (asosiy va reader engine lar)"""
+    pragmas = app.config.get('SQLITE_PRAGMAS', {})
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', partial(_apply_pragmas, pragmas, bind_key == 'reader'))
+
+
+def read(statement):
+    """SELECT ni o'quvchi pool orqali bajarish (sozlanmagan bo'lsa asosiy engine)
+
+    Keshlarni (a'zolik, identity, xabarlar halqasi) to'ldirish uchun emas: replika kechikishi
+    invalidatsiyadan keyin kesh muddati davomida saqlanib qoladi - ular asosiy bazadan o'qiydi.
+    """
+    return db.session.execute(statement, bind_arguments={'bind': db.engines.get('reader', db.engine)})
+
 # User model
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -25,6 +58,19 @@ class User(UserMixin, db.Model):
     owned_groups = db.relationship('Group', back_populates='owner', lazy=True)
     group_memberships = db.relationship('GroupMember', back_populates='user', lazy=True)
     messages = db.relationship('Message', back_populates='user', lazy=True)
+    login_keys = db.relationship('LoginKey', back_populates='user', cascade='all, delete-orphan')
+    
+    @validates('username', 'email')
+    def _sync_login_key(self, kind, value):
+        """username/email o'zgarsa login kaliti ham yangilanadi"""
+        key = LoginKey.normalize(value)
+        for login_key in self.login_keys:
+            if login_key.kind == kind:
+                login_key.key = key
+                break
+        else:
+            self.login_keys.append(LoginKey(key=key, kind=kind))
+        return value
     
     @property
     def password(self):
@@ -32,21 +78,86 @@ class User(UserMixin, db.Model):
     
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def rehash_password(self, password):
+        """Eski sxema/narxdagi hash ni yangilash (parol to'g'ri bo'lganda chaqiriladi)"""
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        self.password = password
+        password_hasher.rehashed += 1
+        return True
     
     def generate_reset_token(self):
         return secrets.token_urlsafe(32)
     
-    def update_last_seen(self):
-        self.last_seen = datetime.utcnow()
-        db.session.commit()
-    
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Login keys (username va email, katta-kichik harfsiz) - bitta PK indeks orqali qidirish
+# Kalitlar turi bo'yicha alohida: username boshqa foydalanuvchining emailiga teng bo'lishi mumkin
+class LoginKey(db.Model):
+    __tablename__ = 'login_keys'
+    
+    key = db.Column(db.String(120), primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)  # username | email
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    
+    user = db.relationship('User', back_populates='login_keys')
+    
+    __table_args__ = (
+        db.Index('ix_login_keys_user_id', 'user_id'),
+    )
+    
+    @staticmethod
+    def normalize(value):
+        return (value or '').strip().casefold()
+    
+    @classmethod
+    def find_user(cls, identifier, kind=None):
+        """Username yoki email bo'yicha foydalanuvchi (bitta indeksli so'rov, username ustun)"""
+        query = User.query.join(cls, cls.user_id == User.id).filter(cls.key == cls.normalize(identifier))
+        if kind is not None:
+            query = query.filter(cls.kind == kind)
+        return query.order_by(cls.kind.desc()).first()
+    
+    @classmethod
+    def taken(cls, username, email):
+        """Ro'yxatdan o'tishda band kalitlar: {'username', 'email'} dan qaysilari (bitta so'rov)"""
+        keys = {(cls.normalize(username), 'username'), (cls.normalize(email), 'email')}
+        rows = db.session.execute(
+            select(cls.key, cls.kind).where(cls.key.in_({key for key, _ in keys}))
+        ).all()
+        return {row.kind for row in rows if (row.key, row.kind) in keys}
+    
+    @classmethod
+    def backfill(cls):
+        """Kalitlari yo'q foydalanuvchilar uchun (login_keys dan oldingi, db.create_all() bilan
+        yangilangan bazalar). Registri bo'yicha takrorlarda kichik id li foydalanuvchi kalitni oladi"""
+        users = db.session.execute(
+            select(User.id, User.username, User.email)
+            .where(~select(cls.user_id).where(cls.user_id == User.id).exists())
+            .order_by(User.id)
+        ).all()
+        if not users:
+            return 0
+        
+        existing = set(db.session.execute(select(cls.key, cls.kind)).all())
+        rows = []
+        for user in users:
+            for kind, value in (('username', user.username), ('email', user.email)):
+                key = cls.normalize(value)
+                if key and (key, kind) not in existing:
+                    existing.add((key, kind))
+                    rows.append({'key': key, 'kind': kind, 'user_id': user.id})
+        if rows:
+            db.session.execute(cls.__table__.insert(), rows)
+        db.session.commit()
+        return len(users)
+
 # Group model
 class Group(db.Model):
     __tablename__ = 'groups'
@@ -65,11 +176,17 @@ class Group(db.Model):
     members = db.relationship('GroupMember', back_populates='group', lazy=True, cascade='all, delete-orphan')
     messages = db.relationship('Message', back_populates='group', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Ochiq guruhlar ro'yxati
+        db.Index('ix_groups_is_private', 'is_private', 'created_at'),
+    )
+    
     def is_owner(self, user):
         return self.owner_id == user.id
     
     def is_member(self, user):
-        return GroupMember.query.filter_by(group_id=self.id, user_id=user.id).first() is not None
+        from cache import membership_cache
+        return membership_cache.is_member(self.id, user.id)
     
     def get_member_count(self):
         return len(self.members)
@@ -95,16 +212,22 @@ class GroupMember(db.Model):
     group = db.relationship('Group', back_populates='members')
     user = db.relationship('User', back_populates='group_memberships')
     
-    __table_args__ = (db.UniqueConstraint('group_id', 'user_id', name='unique_group_member'),)
+    __table_args__ = (
+        db.UniqueConstraint('group_id', 'user_id', name='unique_group_member'),
+        # Foydalanuvchi guruhlari (connect, guruhlar ro'yxati)
+        db.Index('ix_group_members_user_id', 'user_id'),
+    )
+    
+    MANAGER_ROLES = ('owner', 'admin')
     
     def is_admin(self):
-        return self.role in ['owner', 'admin']
+        return self.role in self.MANAGER_ROLES
     
     def can_manage_messages(self):
-        return self.role in ['owner', 'admin']
+        return self.role in self.MANAGER_ROLES
     
     def can_manage_members(self):
-        return self.role in ['owner', 'admin']
+        return self.role in self.MANAGER_ROLES
 
 # Message model with auto-delete
 class Message(db.Model):
@@ -118,24 +241,152 @@ class Message(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, default=lambda: datetime.utcnow() + timedelta(seconds=600))
     is_deleted = db.Column(db.Boolean, default=False)
+    client_id = db.Column(db.String(64), nullable=True)  # klient idempotency kaliti
     
     # Relationships
     user = db.relationship('User', back_populates='messages')
     group = db.relationship('Group', back_populates='messages')
     
+    __table_args__ = (
+        # Guruh tarixi: group_id + is_deleted bo'yicha filtr, (created_at, id) bo'yicha tartib
+        db.Index('ix_messages_group_history', 'group_id', 'is_deleted', 'created_at', 'id'),
+        # Muddati o'tgan xabarlarni tozalash
+        db.Index('ix_messages_expires_at', 'expires_at'),
+        # Qayta yuborilgan xabar dublikat bo'lmasligi uchun
+        db.Index('ix_messages_client_id', 'user_id', 'client_id', unique=True),
+    )
+    
     @classmethod
-    def cleanup_expired(cls):
-        expired = cls.query.filter(
-            cls.expires_at <= datetime.utcnow(),
-            cls.is_deleted == False
+    def find_sent(cls, keys):
+        """(user_id, client_id) kalitlari bo'yicha avval yozilgan xabarlar"""
+        if not keys:
+            return {}
+        rows = db.session.execute(
+            select(cls.id, cls.user_id, cls.group_id, cls.client_id, cls.content, cls.image_url,
+                   cls.created_at, cls.expires_at, cls.is_deleted)
+            .where(tuple_(cls.user_id, cls.client_id).in_(list(keys)))
         ).all()
+        return {(row.user_id, row.client_id): row for row in rows}
+    
+    @classmethod
+    def delete_expired_batch(cls, now, limit=500):
+        """Bitta partiya muddati o'tgan xabarni o'chirish, (id, group_id, image_url) qaytaradi"""
+        if getattr(db.engine.dialect, 'delete_returning', False):
+            ids = select(cls.id).where(cls.expires_at <= now).order_by(cls.expires_at, cls.id).limit(limit)
+            rows = db.session.execute(
+                delete(cls)
+                .where(cls.id.in_(ids))
+                .returning(cls.id, cls.group_id, cls.image_url),
+                execution_options={'synchronize_session': False}
+            ).all()
+        else:
+            # RETURNING yo'q - avval tanlab, keyin id lar bo'yicha o'chirish
+            rows = db.session.execute(
+                select(cls.id, cls.group_id, cls.image_url)
+                .where(cls.expires_at <= now)
+                .order_by(cls.expires_at, cls.id)
+                .limit(limit)
+            ).all()
+            if rows:
+                db.session.execute(
+                    delete(cls).where(cls.id.in_([row.id for row in rows])),
+                    execution_options={'synchronize_session': False}
+                )
         
-        for message in expired:
-            message.is_deleted = True
-            db.session.delete(message)
+        db.session.commit()
+        return rows
+
+# Id bloklari (hi/lo): xabar id si DB ga yozilishidan oldin ma'lum bo'ladi
+class IdSequence(db.Model):
+    __tablename__ = 'id_sequences'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+    
+    @classmethod
+    def reserve(cls, name, count, floor):
+        """[start, start + count) oralig'ini band qilib start ni qaytaradi
+
+        Alohida ulanish va tranzaksiyada - chaqiruvchi sessiyasiga tegmaydi.
+        floor - jadval hali yo'q bo'lsa boshlang'ich qiymat (mavjud id lardan keyin).
+        """
+        for _ in range(2):
+            with db.engine.begin() as conn:
+                updated = conn.execute(
+                    update(cls).where(cls.name == name).values(next_value=cls.next_value + count)
+                ).rowcount
+                if updated:
+                    return conn.execute(select(cls.next_value).where(cls.name == name)).scalar() - count
+            
+            try:
+                with db.engine.begin() as conn:
+                    start = floor(conn)
+                    conn.execute(cls.__table__.insert().values(name=name, next_value=start + count))
+                return start
+            except IntegrityError:
+                # Boshqa worker birinchi bo'lib yaratdi
+                continue
+        raise RuntimeError(f'Id bloki ajratib bo\'lmadi: {name}')
+
+# Content-addressed upload (bir xil rasm diskda bir marta saqlanadi)
+class UploadBlob(db.Model):
+    __tablename__ = 'upload_blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), unique=True, nullable=False)  # sha256 + o'lcham profili
+    path = db.Column(db.String(500), unique=True, nullable=False)  # uploads/cas/ab/<key>.<ext>
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    is_ready = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def acquire(cls, key, path):
+        """Havolani oshirish; (path, is_ready) qaytaradi. Commit chaqiruvchida"""
+        for _ in range(2):
+            blob = cls.query.filter_by(key=key).first()
+            if blob:
+                db.session.execute(
+                    update(cls).where(cls.id == blob.id).values(ref_count=cls.ref_count + 1),
+                    execution_options={'synchronize_session': False}
+                )
+                return blob.path, blob.is_ready
+            
+            try:
+                with db.session.begin_nested():
+                    db.session.add(cls(key=key, path=path, ref_count=1))
+                return path, False
+            except IntegrityError:
+                # Parallel yuklash birinchi bo'lib yozdi
+                continue
+        raise RuntimeError(f'Upload blob yaratib bo\'lmadi: {key}')
+    
+    @classmethod
+    def release(cls, paths):
+        """Havolalarni kamaytirish; oxirgi havolasi ketgan fayllar yo'llarini qaytaradi"""
+        counts = Counter(paths)
+        for path, count in counts.items():
+            db.session.execute(
+                update(cls).where(cls.path == path).values(ref_count=cls.ref_count - count),
+                execution_options={'synchronize_session': False}
+            )
         
+        orphans = db.session.execute(
+            select(cls.path).where(cls.path.in_(list(counts)), cls.ref_count <= 0)
+        ).scalars().all()
+        if orphans:
+            db.session.execute(
+                delete(cls).where(cls.path.in_(orphans)),
+                execution_options={'synchronize_session': False}
+            )
+        return orphans
+    
+    @classmethod
+    def mark_ready(cls, path):
+        db.session.execute(
+            update(cls).where(cls.path == path).values(is_ready=True),
+            execution_options={'synchronize_session': False}
+        )
         db.session.commit()
-        return len(expired)
 
 # Password Reset Token model
 class PasswordResetToken(db.Model):
@@ -167,4 +418,27 @@ class ActivityLog(db.Model):
     ip_address = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    user = db.relationship('User')
\ No newline at end of file
+    user = db.relationship('User')
+    
+    __table_args__ = (
+        # Saqlash muddati bo'yicha tozalash
+        db.Index('ix_activity_logs_created_at', 'created_at'),
+        # Foydalanuvchi tarixi
+        db.Index('ix_activity_logs_user_id', 'user_id', 'created_at'),
+    )
+    
+    @classmethod
+    def cleanup_expired(cls, retention_days=90, chunk_size=1000):
+        """Saqlash muddatidan eski loglarni qismlab o'chirish"""
+        before = datetime.utcnow() - timedelta(days=retention_days)
+        deleted = 0
+        while True:
+            ids = select(cls.id).where(cls.created_at < before).limit(chunk_size)
+            count = db.session.execute(
+                delete(cls).where(cls.id.in_(ids)),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            db.session.commit()
+            deleted += count
+            if count < chunk_size:
+                return deleted
\ No newline at end of file
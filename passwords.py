@@ -0,0 +1,80 @@
+import threading
+
+import bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+try:
+    from eventlet import tpool
+except ImportError:
+    tpool = None
+
+
+class PasswordHasher:
+    """Parol hash lari (bcrypt yoki scrypt) - eventlet hubidan tashqarida (tpool), soni cheklangan
+
+    KDF ataylab sekin: hub ichida bajarilsa, shu jarayondagi barcha websocketlar to'xtab qoladi.
+    Eski sxema yoki narx bilan saqlangan hash lar kirishda qayta hash lanadi (needs_rehash).
+    """
+
+    def __init__(self):
+        self.method = 'bcrypt'
+        self.bcrypt_rounds = 12
+        self.scrypt_cost = (2 ** 15, 8, 1)
+        self._slots = threading.BoundedSemaphore(2)
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'bcrypt')
+        if self.method not in ('bcrypt', 'scrypt'):
+            raise ValueError(f'Noma\'lum PASSWORD_HASH_METHOD: {self.method}')
+        self.bcrypt_rounds = app.config.get('BCRYPT_ROUNDS', 12)
+        self.scrypt_cost = tuple(app.config.get('SCRYPT_COST', (2 ** 15, 8, 1)))
+        self._slots = threading.BoundedSemaphore(app.config.get('PASSWORD_HASH_WORKERS', 2))
+
+    @property
+    def scrypt_method(self):
+        return 'scrypt:{}:{}:{}'.format(*self.scrypt_cost)
+
+    def _offload(self, func, *args):
+        with self._slots:
+            if tpool is not None:
+                return tpool.execute(func, *args)
+            return func(*args)
+
+    def hash(self, password):
+        """Joriy sxema va narx bilan yangi hash"""
+        self.hashed += 1
+        if self.method == 'bcrypt':
+            salt = bcrypt.gensalt(self.bcrypt_rounds)
+            return self._offload(bcrypt.hashpw, password.encode(), salt).decode()
+        return self._offload(generate_password_hash, password, self.scrypt_method)
+
+    def verify(self, stored, password):
+        """bcrypt ($2b$...) va Werkzeug (scrypt:..., pbkdf2:...) hash larini tekshirish"""
+        if not stored:
+            return False
+        self.verified += 1
+        if stored.startswith('$2'):
+            return self._offload(bcrypt.checkpw, password.encode(), stored.encode())
+        return self._offload(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        """Hash joriy sxema/narxdan farq qiladimi (muvaffaqiyatli kirishdan keyin tekshiriladi)"""
+        if self.method == 'bcrypt':
+            # $2b$12$<salt+hash>
+            parts = stored.split('$')
+            return not stored.startswith('$2') or len(parts) < 3 or parts[2] != f'{self.bcrypt_rounds:02d}'
+        return stored.split('$', 1)[0] != self.scrypt_method
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'hashed': self.hashed,
+            'verified': self.verified,
+            'rehashed': self.rehashed,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,157 @@
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import update
+
+from models import db, User
+from cache import membership_cache
+
+
+class PresenceTracker:
+    """Onlayn holat va last_seen ni xotirada saqlab, DB ga partiyalab yozish"""
+
+    def __init__(self):
+        self._connections = {}  # user_id -> ochiq ulanishlar soni
+        self._online = set()    # onlayn deb e'lon qilingan foydalanuvchilar
+        self._dirty = {}        # user_id -> DB ga yozilmagan o'zgarishlar
+        self._lock = threading.Lock()
+        self.app = None
+        self.socketio = None
+        self.debounce = 5
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.debounce = app.config.get('PRESENCE_DEBOUNCE', 5)
+
+    def _mark_dirty(self, user_id):
+        self._dirty[user_id] = {
+            'id': user_id,
+            'is_online': user_id in self._online,
+            'last_seen': datetime.utcnow()
+        }
+
+    def connect(self, user_id, username):
+        """Socket ulanganda chaqiriladi"""
+        with self._lock:
+            self._connections[user_id] = self._connections.get(user_id, 0) + 1
+            # Qisqa uzilishdan keyin qayta ulanish - e'lon qilinmaydi
+            announce = user_id not in self._online
+            self._online.add(user_id)
+            self._mark_dirty(user_id)
+
+        if announce:
+            self._announce('user_online', user_id, username)
+
+    def disconnect(self, user_id, username):
+        """Socket uzilganda chaqiriladi"""
+        with self._lock:
+            remaining = self._connections.get(user_id, 0) - 1
+            if remaining > 0:
+                self._connections[user_id] = remaining
+                return
+            self._connections.pop(user_id, None)
+            self._mark_dirty(user_id)
+
+        self.socketio.start_background_task(self._confirm_offline, user_id, username)
+
+    def _confirm_offline(self, user_id, username):
+        self.socketio.sleep(self.debounce)
+        with self._lock:
+            if self._connections.get(user_id) or user_id not in self._online:
+                return
+            self._online.discard(user_id)
+            self._mark_dirty(user_id)
+
+        with self.app.app_context():
+            self._announce('user_offline', user_id, username)
+
+    def touch(self, user_id):
+        """last_seen ni yangilash (login/logout)"""
+        with self._lock:
+            self._mark_dirty(user_id)
+
+    def is_online(self, user_id):
+        return user_id in self._online
+
+    def _announce(self, event, user_id, username):
+        # Faqat umumiy guruhdagi foydalanuvchilarga
+        rooms = [f'group_{group_id}' for group_id in membership_cache.get_group_ids(user_id)]
+        if rooms:
+            self.socketio.emit(event, {'user_id': user_id, 'username': username}, to=rooms)
+
+    def flush(self):
+        """To'plangan o'zgarishlarni bitta bulk UPDATE bilan yozish"""
+        with self._lock:
+            changes, self._dirty = list(self._dirty.values()), {}
+        if not changes:
+            return 0
+
+        try:
+            db.session.execute(update(User), changes)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Keyingi urinishda qayta yozish (yangiroq o'zgarishlarni bosmasdan)
+            with self._lock:
+                for change in changes:
+                    self._dirty.setdefault(change['id'], change)
+            raise
+        return len(changes)
+
+
+class TypingAggregator:
+    """Guruhda kim yozayotganini yig'ib, har interval uchun bitta snapshot yuborish"""
+
+    def __init__(self):
+        self._typing = {}   # group_id -> {user_id: (username, tugash vaqti)}
+        self._dirty = set()  # snapshot yuborilishi kerak bo'lgan guruhlar
+        self._lock = threading.Lock()
+        self.socketio = None
+        self.ttl = 3
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.ttl = app.config.get('TYPING_TTL', 3)
+
+    def update(self, group_id, user_id, username, is_typing):
+        with self._lock:
+            users = self._typing.setdefault(group_id, {})
+            if is_typing:
+                if user_id not in users:
+                    self._dirty.add(group_id)
+                users[user_id] = (username, time.monotonic() + self.ttl)
+            elif users.pop(user_id, None):
+                self._dirty.add(group_id)
+
+    def _expire(self, now):
+        for group_id, users in list(self._typing.items()):
+            for user_id, (_, expires) in list(users.items()):
+                if expires <= now:
+                    del users[user_id]
+                    self._dirty.add(group_id)
+            if not users:
+                del self._typing[group_id]
+
+    def flush(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            snapshots = {
+                group_id: [
+                    {'user_id': user_id, 'username': username}
+                    for user_id, (username, _) in self._typing.get(group_id, {}).items()
+                ]
+                for group_id in self._dirty
+            }
+            self._dirty.clear()
+
+        for group_id, users in snapshots.items():
+            self.socketio.emit('user_typing', {
+                'group_id': group_id,
+                'users': users
+            }, to=f'group_{group_id}')
+
+
+presence_tracker = PresenceTracker()
+typing_aggregator = TypingAggregator()
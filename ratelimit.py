@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Token bucket: (tokens, updated) -> yangi holat va ruxsat; Redis da atomik bajariladi
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class MemoryBackend:
+    """Bitta jarayon uchun: hisoblagichlar xotirada (hajmi cheklangan, eng eskisi chiqariladi)"""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Bitta token olish; (ruxsat, qolgan tokenlar)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class RedisBackend:
+    """Bir nechta worker uchun: hisoblagichlar Redis da, Lua skript bilan atomik"""
+
+    def __init__(self, url, prefix='chat:ratelimit:'):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, capacity, rate):
+        allowed, tokens = self.script(keys=[self.prefix + key], args=[capacity, rate, time.time()])
+        return bool(allowed), float(tokens)
+
+    def reset(self, key):
+        self.redis.delete(self.prefix + key)
+
+
+class RateLimiter:
+    """Token bucket cheklovlari: RATE_LIMITS = {nom: (urinishlar soni, soniyalar)}
+
+    Tekshiruv DB va KDF ishidan oldin bajariladi; kalit - IP, login yoki user_id.
+    Redis ishlamasa - ruxsat beriladi (fail open).
+    """
+
+    def __init__(self):
+        self.limits = {}
+        self.backend = MemoryBackend()
+        self.rejected = 0
+
+    def init_app(self, app):
+        self.limits = dict(app.config.get('RATE_LIMITS', {}))
+        url = app.config.get('RATELIMIT_STORAGE_URL') or app.config.get('MESSAGE_QUEUE_URL')
+        if url and url.startswith(('redis://', 'rediss://')):
+            self.backend = RedisBackend(url)
+        else:
+            self.backend = MemoryBackend(app.config.get('RATELIMIT_MEMORY_SIZE', 100000))
+
+    def hit(self, name, key):
+        """Urinishni hisoblash; ruxsat bo'lsa 0, aks holda necha soniyadan keyin qayta urinish mumkin"""
+        if name not in self.limits or key is None:
+            return 0
+        count, period = self.limits[name]
+        rate = count / period
+        try:
+            allowed, tokens = self.backend.take(f'{name}:{key}', count, rate)
+        except Exception as e:
+            print(f"Rate limit backend xatoligi: {e}")
+            return 0
+        if allowed:
+            return 0
+        self.rejected += 1
+        return (1 - tokens) / rate
+
+    def reset(self, name, key):
+        """Muvaffaqiyatli urinishdan keyin (masalan to'g'ri parol) hisoblagichni tozalash"""
+        try:
+            self.backend.reset(f'{name}:{key}')
+        except Exception as e:
+            print(f"Rate limit backend xatoligi: {e}")
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,147 @@
+import os
+import random
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class FileLock:
+    """Workerlar orasida lider tanlash uchun fayl qulfi (jarayon tugaguncha ushlab turiladi)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+
+class Job:
+    """Nomlangan davriy vazifa va uning metrikalari"""
+
+    def __init__(self, name, func, interval, leader_only=False, jitter=0.1):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.leader_only = leader_only
+        self.jitter = jitter
+        self.running = False
+        self.next_run = 0
+        self.runs = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.last_rows = 0
+        self.total_rows = 0
+
+    def schedule_next(self):
+        spread = self.interval * self.jitter
+        self.next_run = time.monotonic() + self.interval + random.uniform(-spread, spread)
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'leader_only': self.leader_only,
+            'running': self.running,
+            'runs': self.runs,
+            'errors': self.errors,
+            'last_duration': self.last_duration,
+            'last_rows': self.last_rows,
+            'total_rows': self.total_rows,
+        }
+
+
+class JobScheduler:
+    """Ilova ichidagi yagona davriy vazifalar rejalashtiruvchisi"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.app = None
+        self.socketio = None
+        self.lock = None
+        self.tick = 0.1
+        self.is_leader = False
+        self._started = False
+        self._next_election = 0
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.tick = app.config.get('SCHEDULER_TICK', 0.1)
+
+        lock_path = app.config.get('SCHEDULER_LOCK_FILE')
+        if not lock_path:
+            os.makedirs(app.instance_path, exist_ok=True)
+            lock_path = os.path.join(app.instance_path, 'scheduler.lock')
+        self.lock = FileLock(lock_path)
+
+    def add_job(self, name, func, interval, leader_only=False, jitter=0.1):
+        """func() qayta ishlangan qatorlar sonini qaytarishi mumkin"""
+        self.jobs[name] = Job(name, func, interval, leader_only, jitter)
+
+    def start(self):
+        """Bir marta ishga tushiriladi, qayta chaqiruvlar e'tiborsiz qoldiriladi"""
+        if self._started:
+            return
+        self._started = True
+        self.socketio.start_background_task(self._loop)
+
+    def _loop(self):
+        while True:
+            now = time.monotonic()
+            if not self.is_leader and now >= self._next_election:
+                self._next_election = now + 5
+                if self.lock.acquire():
+                    self.is_leader = True
+                    print(f"👑 Worker {os.getpid()} vazifalar lideri")
+
+            for job in self.jobs.values():
+                if job.running or now < job.next_run:
+                    continue
+                if job.leader_only and not self.is_leader:
+                    continue
+                # Bir vazifa bir vaqtda faqat bitta nusxada ishlaydi
+                job.running = True
+                self.socketio.start_background_task(self._run_job, job)
+
+            self.socketio.sleep(self.tick)
+
+    def _run_job(self, job):
+        started = time.monotonic()
+        try:
+            with self.app.app_context():
+                rows = job.func() or 0
+            job.last_rows = rows
+            job.total_rows += rows
+        except Exception as e:
+            # Sessiya app context yopilganda rollback qilinadi
+            job.errors += 1
+            print(f"Vazifa xatoligi ({job.name}): {e}")
+        finally:
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+            job.schedule_next()
+            job.running = False
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+
+job_scheduler = JobScheduler()
@@ -0,0 +1,115 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+from uploads import upload_urls
+from images import image_pipeline
+
+# Tezroq JSON kutubxonasi bo'lsa o'sha ishlatiladi: orjson > ujson > json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+if orjson is not None:
+    BACKEND = 'orjson'
+    # datetime Flask dagidek (HTTP sana) default() orqali; int kalitlar (rendition o'lchamlari) satrga
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def _dumps(obj, default):
+        return orjson.dumps(obj, default=default, option=_OPTIONS)
+
+    loads = orjson.loads
+elif ujson is not None:
+    BACKEND = 'ujson'
+
+    def _dumps(obj, default):
+        return ujson.dumps(obj, default=default, ensure_ascii=False,
+                           escape_forward_slashes=False).encode()
+
+    loads = ujson.loads
+else:
+    BACKEND = 'json'
+
+    def _dumps(obj, default):
+        return json.dumps(obj, default=default, ensure_ascii=False,
+                          separators=(',', ':')).encode()
+
+    loads = json.loads
+
+
+def dumps(obj):
+    """Obyektni JSON baytlarga (UTF-8, ixcham)"""
+    return _dumps(obj, DefaultJSONProvider.default)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask (jsonify, request.json, tojson) uchun tez JSON; javob tanasi baytlardan to'g'ridan-to'g'ri"""
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent') or kwargs.get('sort_keys'):
+            return super().dumps(obj, **kwargs)
+        return _dumps(obj, self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return json_response(_dumps(obj, self.default), self._app.response_class)
+
+
+class SocketJSON:
+    """Socket.IO paketlari uchun (SocketIO(json=...)); paket xonadagilar uchun bir marta kodlanadi"""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return dumps(obj).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return loads(s)
+
+
+def json_response(body, response_class=None):
+    """Tayyor JSON baytlardan javob"""
+    if response_class is None:
+        from flask import current_app
+        response_class = current_app.response_class
+    return response_class(body, mimetype='application/json')
+
+
+def message_payload(message, author, group_id, client_id=None, image_pending=False):
+    """Xabarning yagona ko'rinishi: hodisa, ack, tarix va bitta xabar uchun
+
+    message - Message, RecentMessage yoki SELECT qatori; author - username va avatar maydonlari bor obyekt.
+    """
+    image_url = message.image_url
+    return {
+        'id': message.id,
+        'user': author.username,
+        'user_id': message.user_id,
+        'user_avatar': author.avatar,
+        'user_avatar_src': upload_urls.sign(author.avatar),
+        'content': message.content,
+        'client_id': client_id,
+        'image_url': image_url,
+        'image_src': None if image_pending else upload_urls.sign(image_url),
+        'image_renditions': None if image_pending else image_pipeline.renditions(image_url),
+        'image_pending': image_pending,
+        'created_at': message.created_at.isoformat(),
+        'expires_at': message.expires_at.isoformat(),
+        'group_id': group_id
+    }
+
+
+def encode_page(parts, next_cursor):
+    """Oldindan kodlangan xabarlardan tarix sahifasi: {"messages": [...], "next_cursor": ...}"""
+    return b'{"messages":[' + b','.join(parts) + b'],"next_cursor":' + dumps(next_cursor) + b'}'
@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Config import paytida o'qiladi, shuning uchun app.py dan oldin
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='chat-tests-'), 'test.db')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from app import app as flask_app
+from models import db
+
+
+def seed():
+    """So'rov rejalari real hajmga yaqin bo'lishi uchun: 500 user, 100 guruh, 5000 a'zo, 20000 xabar"""
+    tables = db.metadata.tables
+    now = datetime.utcnow()
+    db.session.execute(tables['users'].insert(), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+        for i in range(1, 501)
+    ])
+    if 'login_keys' in tables:
+        db.session.execute(tables['login_keys'].insert(), [
+            {'key': key, 'kind': kind, 'user_id': i}
+            for i in range(1, 501)
+            for kind, key in (('username', f'user{i}'), ('email', f'user{i}@example.com'))
+        ])
+    db.session.execute(tables['groups'].insert(), [
+        {'id': i, 'name': f'group{i}', 'owner_id': i, 'is_private': i % 2 == 0,
+         'invite_code': f'invite{i}', 'created_at': now - timedelta(days=i)}
+        for i in range(1, 101)
+    ])
+    # user 1 - 1..10 guruhlar a'zosi
+    db.session.execute(tables['group_members'].insert(), [
+        {'group_id': i % 100 + 1, 'user_id': i // 10 + 1}
+        for i in range(5000)
+    ])
+    db.session.execute(tables['messages'].insert(), [
+        {'id': i, 'group_id': i % 100 + 1, 'user_id': i % 500 + 1, 'content': 'salom',
+         'created_at': now - timedelta(seconds=i),
+         'expires_at': now + timedelta(seconds=600 - i % 900),
+         'is_deleted': False}
+        for i in range(1, 20001)
+    ])
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    flask_app.config['WTF_CSRF_ENABLED'] = False
+    with flask_app.app_context():
+        db.create_all()
+        seed()
+    yield flask_app
+    with flask_app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """user1 nomidan kirgan klient"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
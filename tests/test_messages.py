@@ -0,0 +1,17 @@
+"""Xabar yuborish: client_id bo'yicha qayta yuborish (idempotentlik)"""
+from writer import message_writer
+
+
+def test_resend_after_recent_cache_eviction(app, client):
+    """LRU dan chiqib ketgan client_id - DB dan topiladi, javob birinchisi bilan bir xil"""
+    data = {'content': 'salom', 'client_id': 'resend-1'}
+    first = client.post('/api/groups/7/messages', data=data)
+    assert first.status_code == 200
+    with app.app_context():
+        message_writer.close()
+    message_writer._recent.clear()
+
+    second = client.post('/api/groups/7/messages', data=data)
+    assert second.status_code == 200
+    assert second.json['duplicate'] is True
+    assert second.json['message'] == first.json['message']
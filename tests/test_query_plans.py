@@ -0,0 +1,97 @@
+"""Issiq so'rovlar indeks orqali bajarilishini tekshirish (SQLite EXPLAIN QUERY PLAN)
+
+Har bir test ilovaning o'z kodini (view yoki expiry) chaqiradi, shu paytda bazaga yuborilgan
+SQL ni yozib oladi va rejasida kerakli indeks bilan SEARCH borligini, jadvalni to'liq SCAN va
+ORDER BY uchun vaqtinchalik B-tree yo'qligini tekshiradi. Indeks yoki so'rov o'zgarib,
+reja buzilsa - test yiqiladi.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event, select
+
+from models import db, Message
+from expiry import expiry_engine
+
+
+@contextmanager
+def recorded():
+    """Blok ichida bajarilgan SELECT/DELETE so'rovlari: [(sql, parametrlar)]"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'DELETE')):
+            statements.append((statement, parameters))
+
+    # O'quvchi engine (read()) sozlangan bo'lsa, u ham yoziladi
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', record)
+
+
+def query_plan(statement, parameters):
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+    return [row[3] for row in rows]
+
+
+def assert_indexed(statements, table, index=None):
+    """table ga murojaat qilgan har bir so'rov indeks bilan; index berilsa - kamida bittasida"""
+    plans = [query_plan(statement, parameters) for statement, parameters in statements
+             if f'FROM {table}' in statement]
+    assert plans, f'{table} ga so\'rov bajarilmadi'
+    for plan in plans:
+        assert any(step.startswith('SEARCH') for step in plan), plan
+        assert not any(step.startswith('SCAN') and 'CONSTANT ROW' not in step for step in plan), plan
+        assert not any('TEMP B-TREE' in step for step in plan), plan
+    if index is not None:
+        assert any(index in step for plan in plans for step in plan), (index, plans)
+
+
+def test_history_page(app, client):
+    """messages.get_messages: chuqurroq sahifa (before=<id>) - DB dan"""
+    with app.app_context():
+        before = db.session.execute(
+            select(Message.id).filter(Message.group_id == 7, Message.expires_at > datetime.utcnow())
+            .order_by(Message.created_at.desc()).limit(1).offset(20)
+        ).scalar()
+        with recorded() as statements:
+            response = client.get(f'/api/groups/7/messages?before={before}')
+        assert response.status_code == 200
+        assert_indexed(statements, 'messages', 'ix_messages_group_history')
+
+
+def test_group_members_by_user(app, client):
+    """groups.index: foydalanuvchi a'zo bo'lgan guruhlar"""
+    with app.app_context():
+        with recorded() as statements:
+            assert client.get('/groups/groups').status_code == 200
+        assert_indexed(statements, 'group_members', 'ix_group_members_user_id')
+
+
+def test_public_group_list(app, client):
+    """groups.index: ochiq guruhlar ro'yxati"""
+    with app.app_context():
+        with recorded() as statements:
+            assert client.get('/groups/groups').status_code == 200
+        assert_indexed(statements, 'groups', 'ix_groups_is_private')
+
+
+def test_login_lookup(app):
+    """auth.login: username yoki email bo'yicha foydalanuvchini topish"""
+    with app.app_context():
+        with recorded() as statements:
+            app.test_client().post('/auth/login', data={'username': 'user7@example.com', 'password': 'wrong'})
+        assert_indexed(statements, 'users')
+
+
+def test_expiry_batch(app):
+    """expiry_engine.purge: muddati o'tganlar expires_at tartibida, partiyalab"""
+    with app.app_context():
+        with recorded() as statements:
+            assert expiry_engine.purge(datetime.utcnow()) > 0
+        assert_indexed(statements, 'messages', 'ix_messages_expires_at')
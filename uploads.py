@@ -0,0 +1,96 @@
+import hashlib
+import hmac
+import mimetypes
+import os
+import time
+from urllib.parse import quote
+
+from flask import current_app, request
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from werkzeug.utils import send_from_directory
+
+# Fayl nomlari tasodifiy yoki content-addressed - mazmuni hech qachon o'zgarmaydi
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class UploadUrls:
+    """Yuklangan fayllar uchun imzolangan, muddatli URL lar va ularni yetkazish
+
+    Imzo tekshiruvi (HMAC) sessiya va user-loader DB so'rovini almashtiradi.
+    Yetkazish usullari (UPLOAD_DELIVERY):
+      direct           - ilovaning o'zi (wsgi.file_wrapper bo'lsa sendfile, Range/ETag qo'llanadi)
+      x-sendfile       - Apache/lighttpd X-Sendfile
+      x-accel-redirect - nginx internal location (UPLOAD_ACCEL_PREFIX)
+    """
+
+    def __init__(self):
+        self.upload_folder = None
+        self.secret = b''
+        self.ttl = 3600
+        self.delivery = 'direct'
+        self.accel_prefix = '/protected-uploads/'
+        self.url_prefix = '/uploads/'
+
+    def init_app(self, app):
+        self.upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        self.secret = (app.config.get('UPLOAD_URL_SECRET') or app.config['SECRET_KEY']).encode()
+        self.ttl = app.config.get('UPLOAD_URL_TTL', 3600)
+        self.delivery = app.config.get('UPLOAD_DELIVERY', 'direct')
+        self.accel_prefix = app.config.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+        self.url_prefix = app.config.get('APPLICATION_ROOT', '/').rstrip('/') + '/uploads/'
+
+    def _signature(self, filename, expires):
+        message = f'{filename}:{expires}'.encode()
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()[:32]
+
+    def sign(self, path):
+        """uploads/... yo'lidan imzolangan URL
+
+        Muddat TTL oynasiga yaxlitlanadi: bir oyna davomida URL o'zgarmaydi va brauzer keshi ishlaydi.
+        url_for ishlatilmaydi - fon vazifalarida (request context siz) ham chaqiriladi.
+        """
+        if not path:
+            return None
+        filename = normalize(path)
+        expires = (self.window() + 2) * self.ttl
+        return f'{self.url_prefix}{quote(filename)}?e={expires}&s={self._signature(filename, expires)}'
+
+    def window(self):
+        """Joriy TTL oynasi - shu oyna davomida imzolangan URL lar bir xil"""
+        return int(time.time()) // self.ttl
+
+    def verify(self, filename, expires, signature):
+        if not expires or not signature or not expires.isdigit():
+            return False
+        if int(expires) < time.time():
+            return False
+        return hmac.compare_digest(self._signature(normalize(filename), expires), signature)
+
+    def send(self, filename):
+        """Faylni yetkazish (uzoq muddatli kesh sarlavhalari bilan)"""
+        filename = normalize(filename)
+        if self.delivery == 'x-accel-redirect':
+            if safe_join(self.upload_folder, filename) is None:
+                raise NotFound()
+            response = current_app.response_class()
+            response.headers['X-Accel-Redirect'] = self.accel_prefix + filename
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        else:
+            response = send_from_directory(self.upload_folder, filename, request.environ,
+                                           use_x_sendfile=self.delivery == 'x-sendfile',
+                                           max_age=IMMUTABLE_MAX_AGE)
+
+        response.cache_control.public = None
+        response.cache_control.private = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+
+
+def normalize(path):
+    """Eski havolalar uploads/ prefiksini ikki marta qo'shgan: /uploads/uploads/..."""
+    return path[len('uploads/'):] if path.startswith('uploads/') else path
+
+
+upload_urls = UploadUrls()
@@ -0,0 +1,260 @@
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Message, IdSequence
+from cache import LRUCache
+from bus import message_bus
+from history import recent_messages
+
+# Partiyadagi barcha qatorlar bir xil ustunlar bilan yoziladi (multi-row INSERT)
+COLUMNS = ('id', 'user_id', 'group_id', 'content', 'image_url', 'client_id',
+           'created_at', 'expires_at', 'is_deleted')
+
+
+def _message_id_floor(conn):
+    return (conn.execute(select(func.max(Message.id))).scalar() or 0) + 1
+
+
+class PendingMessage:
+    """DB ga yozilishi kutilayotgan xabar (id oldindan ajratilgan)"""
+
+    __slots__ = ('values', 'done', 'duplicate')
+
+    def __init__(self, values, duplicate=False):
+        self.values = values
+        self.done = threading.Event()
+        self.duplicate = duplicate
+
+    @property
+    def key(self):
+        return (self.values['user_id'], self.values.get('client_id'))
+
+    @property
+    def id(self):
+        return self.values['id']
+
+    @property
+    def group_id(self):
+        return self.values['group_id']
+
+    @property
+    def user_id(self):
+        return self.values['user_id']
+
+    @property
+    def content(self):
+        return self.values['content']
+
+    @property
+    def image_url(self):
+        return self.values['image_url']
+
+    @property
+    def client_id(self):
+        return self.values['client_id']
+
+    @property
+    def created_at(self):
+        return self.values['created_at']
+
+    @property
+    def expires_at(self):
+        return self.values['expires_at']
+
+    def wait(self, timeout=None):
+        """Xabar DB ga yozilguncha kutish"""
+        return self.done.wait(timeout)
+
+
+class MessageWriter:
+    """Write-behind: xabarlar xotiradagi navbatdan partiyalab, bitta tranzaksiyada yoziladi
+
+    Id lar IdSequence bloklaridan (hi/lo) olinadi, shuning uchun xabar DB ga yozilishidan
+    oldin tarqatiladi va yuboruvchiga javob qaytariladi. Yozish xatolik bersa, partiya
+    navbatda qoladi va qayta uriniladi; to'xtashda (close) navbat to'liq yoziladi.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._id_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._started = False
+        self._next_id = 0
+        self._id_limit = 0
+        self._recent = LRUCache(maxsize=10000, ttl=600)  # client_id -> PendingMessage
+        self.app = None
+        self.socketio = None
+        self.batch_size = 100
+        self.window = 0.005
+        self.id_block = 100
+        self.batches = 0
+        self.written = 0
+        self.duplicates = 0
+        self.retries = 0
+        self.last_batch = 0
+        self.last_duration = 0.0
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.batch_size = app.config.get('MESSAGE_BATCH_SIZE', 100)
+        self.window = app.config.get('MESSAGE_BATCH_WINDOW', 0.005)
+        self.id_block = app.config.get('MESSAGE_ID_BLOCK', 100)
+        self._recent = LRUCache(maxsize=app.config.get('MESSAGE_DEDUP_SIZE', 10000),
+                                ttl=app.config.get('MESSAGE_LIFETIME', 600))
+
+    def next_id(self):
+        """Keyingi xabar id si (blok tugaganda DB dan yangisi olinadi)"""
+        with self._id_lock:
+            if self._next_id >= self._id_limit:
+                start = IdSequence.reserve('messages', self.id_block, _message_id_floor)
+                self._next_id, self._id_limit = start, start + self.id_block
+            self._next_id += 1
+            return self._next_id - 1
+
+    def find_sent(self, user_id, client_id):
+        """Shu kalit bilan avval yuborilgan xabar (navbatdagi yoki DB dagi)"""
+        pending = self._recent.get((user_id, client_id))
+        if pending is not None:
+            return pending
+        row = Message.find_sent({(user_id, client_id)}).get((user_id, client_id))
+        if row is None:
+            return None
+        sent = PendingMessage({column: getattr(row, column) for column in COLUMNS},
+                              duplicate=True)
+        sent.done.set()
+        return sent
+
+    def submit(self, **values):
+        """Xabarni navbatga qo'yish; darhol PendingMessage qaytaradi (DB kutilmaydi)
+
+        Shu client_id bilan avval yuborilgan bo'lsa - mavjud xabar, duplicate=True.
+        """
+        if values.get('client_id'):
+            sent = self.find_sent(values['user_id'], values['client_id'])
+            if sent is not None:
+                self.duplicates += 1
+                return PendingMessage(sent.values, duplicate=True)
+
+        values.setdefault('content', None)
+        values.setdefault('image_url', None)
+        values.setdefault('client_id', None)
+        values.setdefault('created_at', datetime.utcnow())
+        values['is_deleted'] = False
+        values['id'] = self.next_id()
+
+        item = PendingMessage(values)
+        if item.key[1]:
+            self._recent.set(item.key, item)
+
+        with self._lock:
+            self._pending.append(item)
+            if not self._started:
+                self._started = True
+                self.socketio.start_background_task(self._run)
+        self._wakeup.set()
+        return item
+
+    def _take(self):
+        with self._lock:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            if not self._pending:
+                self._wakeup.clear()
+        return batch
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._pending[:0] = batch
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Bir vaqtda yuborayotganlar ham shu partiyaga tushishi uchun qisqa kutish
+            self.socketio.sleep(self.window)
+
+            batch = self._take()
+            if not batch:
+                continue
+
+            with self.app.app_context():
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Xabarlarni yozishda xatolik (qayta uriniladi): {e}")
+                    self.retries += 1
+                    self._requeue(batch)
+                    self.socketio.sleep(1)
+
+    def _flush(self, batch):
+        started = time.monotonic()
+        try:
+            self._insert(batch)
+        except IntegrityError:
+            # Boshqa worker shu client_id ni oldinroq yozdi - bittadan qayta
+            db.session.rollback()
+            for item in batch:
+                try:
+                    self._insert([item])
+                except IntegrityError:
+                    db.session.rollback()
+                    self._retract(item)
+
+        for item in batch:
+            item.done.set()
+        self.batches += 1
+        self.last_batch = len(batch)
+        self.last_duration = time.monotonic() - started
+
+    def _insert(self, batch):
+        db.session.execute(insert(Message), [
+            {column: item.values[column] for column in COLUMNS} for item in batch
+        ])
+        db.session.commit()
+        self.written += len(batch)
+
+    def _retract(self, item):
+        """Dublikat bo'lib chiqqan (allaqachon tarqatilgan) xabarni klientlardan olib tashlash"""
+        self.duplicates += 1
+        self._recent.pop(item.key)
+        recent_messages.remove(item.group_id, [item.id])
+        message_bus.emit('delete_group_message', {
+            'message_id': item.id,
+            'group_id': item.group_id
+        }, room=f'group_{item.group_id}')
+
+    def close(self):
+        """Navbatdagi barcha xabarlarni yozish (to'xtashda chaqiriladi)"""
+        with self.app.app_context():
+            while True:
+                batch = self._take()
+                if not batch:
+                    return
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"To'xtashda {len(batch)} ta xabar yozilmadi: {e}")
+                    return
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'batches': self.batches,
+            'written': self.written,
+            'duplicates': self.duplicates,
+            'retries': self.retries,
+            'last_batch': self.last_batch,
+            'last_duration': self.last_duration,
+            'avg_batch': self.written / self.batches if self.batches else 0.0,
+        }
+
+
+message_writer = MessageWriter()